@@ -1,10 +1,66 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 import os
+import json
 from datetime import datetime
 from model_manager import ModelManager
+from training_jobs import TrainingJobManager
+from micro_batcher import MicroBatcher
+from export_watcher import ExportWatcher
+from metrics import registry, profiler
 
 app = Flask(__name__)
-model_manager = ModelManager()
+# MODEL_CONFIG - JSON с настройками модели, например {"classifier": "logistic_regression"}
+model_manager = ModelManager(model_config=json.loads(os.environ.get('MODEL_CONFIG', '{}')))
+# MICRO_BATCHING=1 - запросы /predict собираются в пачки перед вызовом модели
+micro_batcher = MicroBatcher(
+    model_manager,
+    max_batch_size=int(os.environ.get('MICRO_BATCH_MAX_SIZE', 32)),
+    max_wait_ms=float(os.environ.get('MICRO_BATCH_MAX_WAIT_MS', 5))
+) if os.environ.get('MICRO_BATCHING') == '1' else None
+# Состояние задач обучения в файлах - общее для всех воркеров gunicorn
+training_jobs = TrainingJobManager(state_dir=os.environ.get('TRAINING_STATE_DIR', 'cache/jobs'))
+# EXPORT_WATCH=1 - новые выгрузки в папке загружаются и обучаются автоматически
+# (запуск - в воркере после fork, см. gunicorn.conf.py)
+export_watcher = ExportWatcher(
+    "Выгрузка", model_manager.data_loader,
+    retrain=lambda files: training_jobs.submit("watch_excel", _load_and_train)[1],
+    is_busy=training_jobs.is_running,
+    # Манифест этого воркера мог устареть: выгрузку уже обучил и сохранил другой воркер
+    sync=lambda: model_manager.reload_if_changed(force=True),
+    poll_interval=float(os.environ.get('EXPORT_WATCH_INTERVAL', 10)),
+    settle_seconds=float(os.environ.get('EXPORT_WATCH_SETTLE', 30)),
+    cooldown_seconds=float(os.environ.get('EXPORT_RETRAIN_COOLDOWN', 600)),
+    state_dir=os.environ.get('TRAINING_STATE_DIR', 'cache/jobs')
+) if os.environ.get('EXPORT_WATCH') == '1' else None
+
+MAX_BATCH_SIZE = 1000  # Максимум заявок в одном запросе /predict_batch
+DEFAULT_TOP_K = 3  # Сколько альтернативных групп/экспертов/меток возвращать
+MAX_TOP_K = 10
+MAX_SIMILAR = 20  # Максимум похожих исторических заявок в ответе /predict
+
+
+def _parse_limit(data, field, default, maximum):
+    """Целое число из запроса, ограниченное диапазоном [0, maximum]"""
+    try:
+        value = int(data.get(field, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(0, min(value, maximum))
+
+def _parse_top_k(data):
+    """Число альтернатив из запроса, ограниченное диапазоном [0, MAX_TOP_K]"""
+    return _parse_limit(data, 'top_k', DEFAULT_TOP_K, MAX_TOP_K)
+
+def load_saved_model():
+    """Загрузка сохраненной модели при старте (до fork воркеров в продакшн-режиме)"""
+    if os.path.exists("model"):
+        print("📂 Попытка загрузить сохраненную модель...")
+        model_manager.load_model()
+
+@app.before_request
+def sync_model():
+    """Подхватить модель, переобученную другим воркером"""
+    model_manager.reload_if_changed()
 
 @app.route('/')
 def home():
@@ -21,71 +77,138 @@ def predict():
         title = data['title']
         description = data.get('description', '')
         
-        prediction = model_manager.predict(title, description)
+        predictor = micro_batcher or model_manager
+        with profiler.profile("predict"):
+            prediction = predictor.predict(title, description, top_k=_parse_top_k(data))
         
-        return jsonify({
+        response = {
             "prediction": prediction,
             "status": "success",
             "model_trained": model_manager.is_trained,
             "timestamp": datetime.now().isoformat()
+        }
+        # "similar": N - добавить N похожих исторических заявок
+        similar = _parse_limit(data, 'similar', 0, MAX_SIMILAR)
+        if similar:
+            response["similar_tickets"] = model_manager.find_similar(title, description, top_k=similar)
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """Пакетное предсказание для списка заявок"""
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('items'), list):
+            return jsonify({"error": "Missing 'items' list"}), 400
+        
+        items = data['items']
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Too many items: maximum {MAX_BATCH_SIZE} per request"}), 400
+        
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or 'title' not in item:
+                return jsonify({"error": f"Missing 'title' field in item {i}"}), 400
+        
+        with profiler.profile("predict_batch"):
+            predictions = model_manager.predict_batch(items, top_k=_parse_top_k(data))
+        
+        return jsonify({
+            "predictions": predictions,
+            "count": len(predictions),
+            "status": "success",
+            "model_trained": model_manager.is_trained,
+            "timestamp": datetime.now().isoformat()
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _load_and_train(force_reload=False):
+    """Загрузка Excel, обучение и сохранение модели; результат в формате ответа API"""
+    success = model_manager.load_and_train("Выгрузка", force_reload=force_reload)
+    
+    if not success:
+        return {
+            "status": "error",
+            "message": ("Не удалось перезагрузить данные из Excel файлов" if force_reload
+                        else "Не удалось загрузить данные из Excel файлов")
+        }
+    
+    model_manager.save_model()
+    
+    return {
+        "status": "success",
+        "message": ("Данные принудительно перезагружены и модель переобучена" if force_reload
+                    else "Данные успешно загружены и модель обучена"),
+        "records_loaded": model_manager.get_data_stats()["total_records"],
+        "model_trained": model_manager.is_trained,
+        "loaded_files_info": model_manager.data_loader.get_loaded_files_info()
+    }
+
+def _start_training(force_reload=False):
+    """Обучение в фоне (по умолчанию) или с ожиданием результата при ?wait=1
+    
+    В обоих случаях - через training_jobs: обучение идет не больше чем в одном воркере.
+    """
+    name = "force_reload_excel" if force_reload else "load_excel"
+    job, created = training_jobs.submit(name, _load_and_train, force_reload)
+    
+    if request.args.get('wait') == '1':
+        if not created:
+            return jsonify({
+                "status": "already_running",
+                "message": "Обучение уже выполняется",
+                "job": job
+            }), 409
+        job = training_jobs.wait(job["job_id"])
+        result = job["result"] or {"status": "error", "message": job["error"]}
+        return jsonify(result), (200 if result["status"] == "success" else 400)
+    
+    return jsonify({
+        "status": "accepted" if created else "already_running",
+        "message": "Обучение запущено в фоне" if created else "Обучение уже выполняется",
+        "job_id": job["job_id"],
+        "job": job,
+        "status_url": f"/training_status/{job['job_id']}"
+    }), 202
+
 @app.route('/load_excel', methods=['GET'])
 def load_excel():
-    """Загрузка данных из Excel файлов (только новых)"""
+    """Загрузка данных из Excel файлов (только новых) и обучение модели в фоне"""
     try:
-        success = model_manager.load_and_train("Выгрузка")
-        
-        if success:
-            model_manager.save_model()
-            
-            return jsonify({
-                "status": "success",
-                "message": "Данные успешно загружены и модель обучена",
-                "records_loaded": model_manager.get_data_stats()["total_records"],
-                "model_trained": model_manager.is_trained,
-                "loaded_files_info": model_manager.data_loader.get_loaded_files_info()
-            })
-        else:
-            return jsonify({
-                "status": "error",
-                "message": "Не удалось загрузить данные из Excel файлов"
-            }), 400
-        
+        return _start_training(force_reload=False)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/force_reload_excel', methods=['GET'])
 def force_reload_excel():
-    """Принудительная перезагрузка всех Excel файлов"""
+    """Принудительная перезагрузка всех Excel файлов и переобучение в фоне"""
     try:
-        # Помечаем все файлы для перезагрузки
-        model_manager.data_loader.force_reload_all("Выгрузка")
-        
-        success = model_manager.load_and_train("Выгрузка")
-        
-        if success:
-            model_manager.save_model()
-            
-            return jsonify({
-                "status": "success",
-                "message": "Данные принудительно перезагружены и модель переобучена",
-                "records_loaded": model_manager.get_data_stats()["total_records"],
-                "model_trained": model_manager.is_trained,
-                "loaded_files_info": model_manager.data_loader.get_loaded_files_info()
-            })
-        else:
-            return jsonify({
-                "status": "error",
-                "message": "Не удалось перезагрузить данные из Excel файлов"
-            }), 400
-        
+        return _start_training(force_reload=True)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/training_status', methods=['GET'])
+def training_status_list():
+    """Последние задачи обучения"""
+    return jsonify({
+        "training_running": training_jobs.is_running(),
+        "jobs": training_jobs.list_jobs()
+    })
+
+@app.route('/training_status/<job_id>', methods=['GET'])
+def training_status(job_id):
+    """Состояние задачи обучения"""
+    job = training_jobs.get_job(job_id)
+    if not job:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    return jsonify(job)
+
 @app.route('/save_model', methods=['GET'])
 def save_model():
     """Сохранение модели"""
@@ -102,6 +225,8 @@ def save_model():
 def load_model():
     """Загрузка модели"""
     try:
+        if training_jobs.is_running():
+            return jsonify({"error": "Идет обучение модели, повторите после его окончания"}), 409
         success = model_manager.load_model()
         return jsonify({
             "status": "success" if success else "error",
@@ -115,8 +240,48 @@ def stats():
     """Статистика модели"""
     stats = model_manager.get_data_stats()
     stats["loaded_files_info"] = model_manager.data_loader.get_loaded_files_info()
+    stats["last_training"] = model_manager.last_training_info
+    stats["model_version"] = model_manager.model_version
+    stats["prediction_cache"] = model_manager.prediction_cache.get_info()
+    stats["micro_batching"] = micro_batcher.get_info() if micro_batcher else {"enabled": False}
+    stats["export_watcher"] = export_watcher.get_info() if export_watcher else {"enabled": False}
+    stats["stage_timings"] = registry.get_summary()
     return jsonify(stats)
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики в формате Prometheus: длительность этапов, ошибки и состояние модели"""
+    cache_info = model_manager.prediction_cache.get_info()
+    gauges = {
+        "model_trained": model_manager.is_trained,
+        "model_version": model_manager.model_version,
+        "training_records": len(model_manager.data_loader.historical_data),
+        "training_running": training_jobs.is_running(),
+        "prediction_cache_size": cache_info["size"],
+        "prediction_cache_hits": cache_info["hits"],
+        "prediction_cache_misses": cache_info["misses"],
+    }
+    if micro_batcher:
+        batching_info = micro_batcher.get_info()
+        gauges["micro_batches"] = batching_info["batches"]
+        gauges["micro_batch_items"] = batching_info["items"]
+    return Response(registry.render(gauges), mimetype="text/plain; version=0.0.4")
+
+@app.route('/profiling', methods=['GET', 'POST'])
+def profiling():
+    """Выборочное профилирование запросов предсказания
+    
+    POST {"sample_rate": 0.01} - профилировать каждый сотый запрос, 0 - выключить;
+    "reset": true - сбросить накопленную статистику. GET - отчет cProfile по участкам.
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            profiler.configure(sample_rate=data.get('sample_rate'), reset=bool(data.get('reset')))
+        return jsonify(profiler.get_report(limit=int(request.args.get('limit', 25))))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
 @app.route('/get_data', methods=['GET'])
 def get_data():
     """Получить списки групп, экспертов и меток"""
@@ -132,6 +297,7 @@ def health():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "model_status": "trained" if model_manager.is_trained else "not_trained",
+        "training_running": training_jobs.is_running(),
         "loaded_files_info": model_manager.data_loader.get_loaded_files_info()
     })
 
@@ -139,6 +305,8 @@ def health():
 def clear_model():
     """Очистка модели - удаление всех файлов"""
     try:
+        if training_jobs.is_running():
+            return jsonify({"error": "Идет обучение модели, повторите после его окончания"}), 409
         success = model_manager.clear_model()
         return jsonify({
             "status": "success" if success else "error",
@@ -151,19 +319,23 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     
     # Пытаемся загрузить сохраненную модель при старте
-    if os.path.exists("model"):
-        print("📂 Попытка загрузить сохраненную модель...")
-        model_manager.load_model()
+    load_saved_model()
+    if export_watcher:
+        export_watcher.start()
     
     print(f"🚀 Starting AI Server on port {port}...")
     print("📡 Endpoints:")
     print("   GET / - Веб-интерфейс")
-    print("   POST /predict - Предсказание для заявки")
-    print("   GET /load_excel - Загрузка данных из Excel")
+    print("   POST /predict - Предсказание для заявки (\"similar\": N - похожие заявки из истории)")
+    print("   POST /predict_batch - Пакетное предсказание для списка заявок")
+    print("   GET /load_excel - Загрузка данных из Excel (обучение в фоне, ?wait=1 - синхронно)")
     print("   GET /force_reload_excel - Принудительная перезагрузка всех Excel файлов")
+    print("   GET /training_status/<job_id> - Состояние фонового обучения")
     print("   GET /save_model - Сохранение модели")
     print("   GET /load_model - Загрузка модели")
     print("   GET /stats - Статистика")
     print("   GET /get_data - Списки групп и экспертов")
+    print("   GET /metrics - Метрики в формате Prometheus")
+    print("   GET|POST /profiling - Выборочное профилирование запросов")
     
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
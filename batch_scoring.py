@@ -0,0 +1,266 @@
+"""Пакетная разметка целой выгрузки (xlsx или CSV) сохраненной моделью
+
+Файл читается порциями (xlsx - openpyxl в режиме read-only, CSV - pandas по chunksize),
+порции размечаются predict_batch в пуле процессов и пишутся в выходной файл в исходном
+порядке: ко всем столбцам выгрузки добавляются прогноз группы/эксперта/метки,
+уверенность и признак модерации. Память не зависит от размера выгрузки.
+
+Запуск (без Flask):
+    python batch_scoring.py backlog.xlsx routed.xlsx
+    python batch_scoring.py backlog.csv routed.csv --workers 4 --sep ";"
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, nullcontext
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from data_loader import DataLoader, STREAM_PROGRESS_SECONDS, _excel_value
+from model_manager import ModelManager
+
+# Столбцы с результатом, добавляемые к столбцам выгрузки, и поля предсказания для них
+OUTPUT_COLUMNS = {
+    'Прогноз: группа': 'group',
+    'Прогноз: эксперт': 'expert',
+    'Прогноз: метка': 'label',
+    'Уверенность': 'confidence',
+    'Уверенность: группа': 'group_confidence',
+    'Уверенность: эксперт': 'expert_confidence',
+    'Уверенность: метка': 'label_confidence',
+    'Требует модерации': 'needs_moderation',
+    'Причина модерации': 'moderation_reason',
+}
+SCORING_CHUNK_ROWS = 5000  # Строк в одной порции разметки
+
+# Модель процесса пула: при fork наследуется от родителя, иначе загружается в _init_worker
+_worker_manager = None
+
+
+def score_file(input_path, output_path, model_folder="model", workers=None,
+               chunk_rows=SCORING_CHUNK_ROWS, sep=",", encoding="utf-8-sig"):
+    """Разметить выгрузку input_path и записать результат в output_path (xlsx или csv)
+
+    Возвращает число размеченных строк.
+    """
+    global _worker_manager
+    manager = ModelManager()
+    if not manager.load_model(model_folder):
+        raise RuntimeError(f"Не удалось загрузить модель из '{model_folder}'")
+    # Тексты выгрузки почти не повторяются - кэш предсказаний только занимал бы память
+    manager.prediction_cache.max_size = 0
+    _worker_manager = manager
+
+    workers = workers or os.cpu_count() or 1
+    chunks = _read_chunks(input_path, chunk_rows, sep, encoding)
+    name = os.path.basename(input_path)
+    print(f"🏷️ Разметка {name}: {workers} процесс(ов), по {chunk_rows} строк")
+    start_time = time.perf_counter()
+    last_report = start_time
+    rows_scored = moderated = 0
+
+    with _open_writer(output_path, encoding) as writer, _scoring_pool(workers, model_folder) as pool:
+        for df, predictions in _score_chunks(chunks, pool, workers):
+            result = _with_predictions(df, predictions)
+            writer.write(result)
+            rows_scored += len(result)
+            moderated += int(result['Требует модерации'].sum())
+
+            now = time.perf_counter()
+            if now - last_report >= STREAM_PROGRESS_SECONDS:
+                last_report = now
+                print(f"   ⏳ {name}: {rows_scored} строк, {rows_scored / (now - start_time):.0f} строк/с")
+
+    seconds = time.perf_counter() - start_time
+    print(f"✅ Размечено {rows_scored} строк за {seconds:.1f} с ({rows_scored / max(seconds, 1e-9):.0f} строк/с), "
+          f"на модерацию: {moderated}")
+    print(f"💾 Результат: {output_path}")
+    return rows_scored
+
+
+def _score_chunks(chunks, pool, workers):
+    """Пары (порция, предсказания) в порядке чтения; в пуле одновременно до 2*workers порций"""
+    if pool is None:
+        for df in chunks:
+            yield df, _score_items(_chunk_items(df))
+        return
+
+    pending = []
+    for df in chunks:
+        pending.append((df, pool.submit(_score_items, _chunk_items(df))))
+        if len(pending) >= 2 * workers:
+            df, future = pending.pop(0)
+            yield df, future.result()
+    for df, future in pending:
+        yield df, future.result()
+
+
+def _chunk_items(df):
+    """Заголовок и описание заявок порции - с той же очисткой, что и при загрузке выгрузок"""
+    title = DataLoader._clean_text_column(df['Заголовок']).fillna("")
+    if 'Описание' in df.columns:
+        description = DataLoader._clean_text_column(df['Описание']).fillna("")
+    else:
+        description = pd.Series("", index=df.index)
+    return [{"title": t, "description": d} for t, d in zip(title, description)]
+
+
+def _score_items(items):
+    """Предсказания для заявок; заявки без заголовка не размечаются (None)"""
+    positions = [i for i, item in enumerate(items) if item["title"]]
+    predictions = [None] * len(items)
+    for i, prediction in zip(positions, _worker_manager.predict_batch([items[i] for i in positions])):
+        predictions[i] = prediction
+    return predictions
+
+
+def _with_predictions(df, predictions):
+    """Порция выгрузки с добавленными столбцами результата"""
+    result = df.copy()
+    for column, field in OUTPUT_COLUMNS.items():
+        result[column] = [prediction[field] if prediction else None for prediction in predictions]
+    empty = [prediction is None for prediction in predictions]
+    result.loc[empty, 'Требует модерации'] = True
+    result.loc[empty, 'Причина модерации'] = "Пустой заголовок"
+    result['Требует модерации'] = result['Требует модерации'].astype(bool)
+    return result
+
+
+def _read_chunks(input_path, chunk_rows, sep, encoding):
+    """Порции выгрузки как DataFrame (типы значений - как у pd.read_excel / pd.read_csv)"""
+    if input_path.lower().endswith(".csv"):
+        reader = pd.read_csv(input_path, sep=sep, encoding=encoding, chunksize=chunk_rows)
+    else:
+        reader = _read_excel_chunks(input_path, chunk_rows)
+
+    for df in reader:
+        if 'Заголовок' not in df.columns:
+            raise ValueError(f"В файле {os.path.basename(input_path)} нет столбца 'Заголовок'")
+        df = df.dropna(how='all')
+        if len(df):
+            yield df
+
+
+def _read_excel_chunks(file_path, chunk_rows):
+    """Потоковое чтение первого листа xlsx порциями по chunk_rows строк (как DataLoader._stream_file)"""
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        header = [value if value is not None else f"Unnamed: {i}"
+                  for i, value in enumerate(next(rows, None) or [])]
+        if not header:
+            return
+
+        chunk = []
+        for row in rows:
+            chunk.append([_excel_value(row[i]) if i < len(row) else None for i in range(len(header))])
+            if len(chunk) >= chunk_rows:
+                yield TextParser([header] + chunk, header=0).read()
+                chunk = []
+        if chunk:
+            yield TextParser([header] + chunk, header=0).read()
+    finally:
+        workbook.close()
+
+
+class _CsvWriter:
+    """Запись CSV порциями: заголовок с первой порцией, дальше дописывание"""
+
+    def __init__(self, path, encoding):
+        self.path = path
+        self.encoding = encoding
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.path, mode="w" if self.header else "a", header=self.header,
+                  index=False, encoding=self.encoding)
+        self.header = False
+
+    def close(self):
+        if self.header:
+            pd.DataFrame(columns=list(OUTPUT_COLUMNS)).to_csv(self.path, index=False, encoding=self.encoding)
+
+
+class _ExcelWriter:
+    """Запись xlsx в режиме write-only: строки сразу сбрасываются на диск"""
+
+    def __init__(self, path):
+        self.path = path
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.header = True
+
+    def write(self, df):
+        if self.header:
+            self.sheet.append([str(column) for column in df.columns])
+            self.header = False
+        for row in df.itertuples(index=False):
+            self.sheet.append([_cell_value(value) for value in row])
+
+    def close(self):
+        if self.header:
+            self.sheet.append(list(OUTPUT_COLUMNS))
+        self.workbook.save(self.path)
+
+
+def _open_writer(output_path, encoding):
+    if output_path.lower().endswith(".csv"):
+        return closing(_CsvWriter(output_path, encoding))
+    return closing(_ExcelWriter(output_path))
+
+
+def _cell_value(value):
+    """Значение DataFrame для ячейки openpyxl: пропуски - пустая ячейка, numpy - python-типы"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _scoring_pool(workers, model_folder):
+    """Пул процессов разметки (None при workers=1 - разметка в этом процессе)"""
+    if workers <= 1:
+        return nullcontext()
+    # fork: процессы получают уже загруженную модель без повторной загрузки и копирования
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=_init_worker, initargs=(model_folder,))
+
+
+def _init_worker(model_folder):
+    """Загрузка модели в процессе пула, если она не унаследована от родителя"""
+    global _worker_manager
+    if _worker_manager is None:
+        _worker_manager = ModelManager()
+        if not _worker_manager.load_model(model_folder):
+            raise RuntimeError(f"Не удалось загрузить модель из '{model_folder}'")
+        _worker_manager.prediction_cache.max_size = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная разметка выгрузки сохраненной моделью")
+    parser.add_argument("input", help="Выгрузка .xlsx или .csv (нужен столбец 'Заголовок', 'Описание' - по желанию)")
+    parser.add_argument("output", help="Файл результата .xlsx или .csv")
+    parser.add_argument("--model", default="model", help="Папка сохраненной модели")
+    parser.add_argument("--workers", type=int, help="Число процессов (по умолчанию - по числу CPU)")
+    parser.add_argument("--chunk-rows", type=int, default=SCORING_CHUNK_ROWS, help="Строк в одной порции")
+    parser.add_argument("--sep", default=",", help="Разделитель входного CSV")
+    parser.add_argument("--encoding", default="utf-8-sig", help="Кодировка входного и выходного CSV")
+    args = parser.parse_args()
+
+    score_file(args.input, args.output, args.model, args.workers, args.chunk_rows, args.sep, args.encoding)
+
+
+if __name__ == "__main__":
+    main()
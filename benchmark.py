@@ -0,0 +1,885 @@
+"""Бенчмарки производительности сервиса
+
+Запуск:
+    python benchmark.py suite --rows 1000 100000 1000000 --json bench/main.json
+    python benchmark.py compare bench/main.json bench/branch.json
+    python benchmark.py ingest --rows 1000 10000 100000
+    python benchmark.py ingest --rows 100000 --files 20 --workers 8
+    python benchmark.py incremental --rows 20000 --delta-share 0.1
+    python benchmark.py heads --rows 20000
+    python benchmark.py backends --rows 20000
+    python benchmark.py artifact --rows 20000
+    python benchmark.py features --rows 100000 --delta-share 0.1
+    python benchmark.py forest --rows 100000
+    python benchmark.py microbatch --concurrency 1 8 32 --max-batch-size 32 --max-wait-ms 5
+    python benchmark.py gunicorn --concurrency 1 8 32 --workers 1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+try:
+    import resource
+except ImportError:  # Windows: пиковая память не измеряется
+    resource = None
+
+from data_loader import DataLoader, INGESTION_RECORDS_FILE, INGESTION_MANIFEST_FILE
+import joblib
+
+from model_manager import (ModelManager, HEADS, MODEL_BUNDLE_FILE, DEFAULT_MODEL_CONFIG,
+                           predict_proba)
+from micro_batcher import MicroBatcher
+from record_store import RecordStore
+import text_features
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Темы синтетических заявок: группа, ее эксперты, метки и характерные слова
+TOPICS = [
+    ("Группа технической поддержки пользователей",
+     ["Иванов Иван Иванович", "Сидорова Анна Сергеевна", "Орлов Денис Павлович"],
+     ["Диагностика компьютерного оборудования", "Замена картриджа"],
+     ["принтер", "монитор", "компьютер", "мышь", "клавиатура", "картридж", "печать"]),
+    ("Группа поддержки и разработки 1С",
+     ["Петров Петр Петрович", "Кузнецов Алексей Викторович"],
+     ["1С УПП", "1С Документооборот"],
+     ["1С", "отчет", "выгрузка", "документ", "проводка", "справочник", "обработка"]),
+    ("Группа сетевого администрирования",
+     ["Смирнова Ольга Николаевна", "Волков Сергей Андреевич"],
+     ["Настройка сети", "VPN доступ"],
+     ["сеть", "интернет", "VPN", "wifi", "роутер", "кабель", "подключение"]),
+    ("Группа информационной безопасности",
+     ["Морозов Игорь Олегович", "Лебедева Мария Ивановна"],
+     ["Сброс пароля", "Предоставление доступа"],
+     ["пароль", "сброс", "доступ", "учетная", "запись", "блокировка", "права"]),
+    ("Группа поддержки web-сайтов",
+     ["Новиков Артем Ильич"],
+     ["Разместить/Изменить/Удалить информацию на web-сайте"],
+     ["сайт", "страница", "новость", "баннер", "разместить", "публикация", "web"]),
+]
+COMMON_WORDS = ["не", "работает", "прошу", "помочь", "срочно", "ошибка", "настроить", "изменения"]
+
+
+def generate_tickets(rows, seed=42):
+    """Синтетическая выгрузка заявок в формате столбцов реальных xlsx
+
+    Слова заявки зависят от темы, поэтому модели есть чему учиться;
+    около 5% экспертов - некорректные имена, около 10% заявок без описания.
+    """
+    rng = random.Random(seed)
+
+    def sentence(topic_words, low, high):
+        return " ".join(rng.choice(topic_words) if rng.random() < 0.6 else rng.choice(COMMON_WORDS)
+                        for _ in range(rng.randint(low, high)))
+
+    titles, descriptions, experts, groups, labels = [], [], [], [], []
+    for _ in range(rows):
+        group, topic_experts, topic_labels, topic_words = rng.choice(TOPICS)
+        titles.append(sentence(topic_words, 2, 6))
+        descriptions.append(sentence(topic_words, 5, 40) if rng.random() > 0.1 else None)
+        experts.append(rng.choice(topic_experts) if rng.random() > 0.05 else "deleted")
+        groups.append(group)
+        labels.append(rng.choice(topic_labels))
+
+    start = pd.Timestamp("2025-01-01")
+    return pd.DataFrame({
+        "Код": np.arange(100000, 100000 + rows),
+        "Время закрытия": [start + pd.Timedelta(minutes=7 * i) for i in range(rows)],
+        "Заголовок": titles,
+        "Назначенный эксперт Имя": experts,
+        "Описание": descriptions,
+        "Группа экспертов Имя": groups,
+        "Предложение Отображаемая метка": labels,
+        "URL": [f"https://sms.example/saw/Request/{100000 + i}" for i in range(rows)],
+    })
+
+
+def generate_records(rows, seed=42):
+    """Синтетические записи в формате DataLoader.historical_data"""
+    records, _ = _timed(DataLoader(cache_dir=None)._parse_excel_frame, generate_tickets(rows, seed), "synthetic.xlsx")
+    return records
+
+
+def write_workbooks(folder, rows, files=1, seed=42):
+    """Записать rows заявок, разбитых на files xlsx файлов"""
+    df = generate_tickets(rows, seed)
+    paths = []
+    for i, chunk in enumerate(np.array_split(np.arange(rows), files)):
+        path = os.path.join(folder, f"export_{i:03d}.xlsx")
+        df.iloc[chunk].to_excel(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def _timed(func, *args, **kwargs):
+    """Выполнить функцию без вывода в консоль и вернуть (результат, секунды)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, elapsed
+
+
+def _parse_rows_legacy(loader, df, file_path):
+    """Прежний построчный парсинг через iterrows и _parse_excel_row"""
+    records = []
+    for _, row in df.iterrows():
+        record = loader._parse_excel_row(row, file_path)
+        if record:
+            records.append(record)
+    return records
+
+
+def bench_ingest(rows_list, seed=42, files=1, workers=1):
+    """Сравнение построчного и векторизованного парсинга выгрузок"""
+    results = []
+    for rows in rows_list:
+        with tempfile.TemporaryDirectory() as folder:
+            path = write_workbooks(folder, rows, files=files, seed=seed)[0]
+            df, read_time = _timed(lambda: pd.read_excel(path).dropna(how='all'))
+
+            loader = DataLoader(cache_dir=None)
+            legacy, legacy_time = _timed(_parse_rows_legacy, loader, df, path)
+            vectorized, vectorized_time = _timed(loader._parse_excel_frame, df, path)
+            _, load_time = _timed(DataLoader(cache_dir=None).load_from_excel, folder, workers=1)
+            _, parallel_time = _timed(DataLoader(cache_dir=None).load_from_excel, folder, workers=workers)
+
+            # Холодная загрузка заполняет кэш, повторная читает только его
+            cache_dir = os.path.join(folder, "cache")
+            _, cold_time = _timed(DataLoader(cache_dir=cache_dir).load_from_excel, folder)
+            _, warm_time = _timed(DataLoader(cache_dir=cache_dir).load_from_excel, folder)
+
+        results.append({
+            "rows": rows,
+            "records": len(vectorized),
+            "records_match": legacy == vectorized,
+            "read_excel_s": round(read_time, 4),
+            "parse_legacy_s": round(legacy_time, 4),
+            "parse_vectorized_s": round(vectorized_time, 4),
+            "parse_speedup": round(legacy_time / vectorized_time, 1) if vectorized_time else None,
+            "files": files,
+            "load_from_excel_s": round(load_time, 4),
+            "workers": workers,
+            "load_parallel_s": round(parallel_time, 4),
+            "load_cache_cold_s": round(cold_time, 4),
+            "load_cache_warm_s": round(warm_time, 4),
+        })
+        print(f"📊 {rows} строк: iterrows {legacy_time:.3f}s, "
+              f"векторизованно {vectorized_time:.3f}s, чтение xlsx {read_time:.3f}s, "
+              f"из кэша {warm_time:.3f}s")
+    return results
+
+
+def _heads_accuracy(manager, records):
+    """Точность каждой головы модели на записях"""
+    predictions = manager._predict_texts([record['full_text'] for record in records])
+    return {
+        field: round(float(np.mean([p[field] == r[field] for p, r in zip(predictions, records)])), 3)
+        for field, _, _ in HEADS
+    }
+
+
+def _train_on(manager, records):
+    """Полное обучение менеджера на заданных записях"""
+    if not isinstance(records, RecordStore):
+        records = RecordStore(records)
+    manager.data_loader.historical_data = records
+    _, elapsed = _timed(manager._train_model)
+    return elapsed
+
+
+def bench_incremental(rows, delta_share=0.1, test_share=0.1, seed=42):
+    """Инкрементальное дообучение на новой порции данных против полного переобучения
+
+    Записи делятся по времени: база, новая порция (delta) и отложенная выборка для оценки.
+    """
+    records = generate_records(rows, seed)
+    test_size = int(len(records) * test_share)
+    delta_size = int(len(records) * delta_share)
+    base = records[:len(records) - test_size - delta_size]
+    delta = records[len(base):len(base) + delta_size]
+    test = records[len(base) + delta_size:]
+
+    forest = ModelManager()
+    forest_full_time = _train_on(forest, base + delta)
+
+    full = ModelManager(model_config={"incremental": True})
+    sgd_full_time = _train_on(full, base + delta)
+
+    incremental = ModelManager(model_config={"incremental": True})
+    _train_on(incremental, base)
+    accuracy_stale = _heads_accuracy(incremental, test)
+    result, delta_time = _timed(incremental._train_incremental, delta)
+
+    report = {
+        "rows": rows,
+        "base_records": len(base),
+        "delta_records": len(delta),
+        "test_records": len(test),
+        "forest_full_retrain_s": round(forest_full_time, 3),
+        "sgd_full_retrain_s": round(sgd_full_time, 3),
+        "sgd_incremental_s": round(delta_time, 3),
+        "incremental_applied": result is True,
+        "accuracy_forest_full": _heads_accuracy(forest, test),
+        "accuracy_sgd_full": _heads_accuracy(full, test),
+        "accuracy_sgd_before_delta": accuracy_stale,
+        "accuracy_sgd_incremental": _heads_accuracy(incremental, test),
+    }
+    print(f"📊 {rows} строк: полное переобучение RF {forest_full_time:.2f}s, SGD {sgd_full_time:.2f}s, "
+          f"дообучение на {len(delta)} записях {delta_time:.2f}s")
+    return [report]
+
+
+# Настройки признаков текста для сравнения (поверх DEFAULT_MODEL_CONFIG)
+FEATURE_CONFIGS = [
+    ("word_tfidf", {}),
+    ("word_tfidf_float64", {"text_dtype": "float64"}),
+    ("normalized_stem6", {"normalize_text": True, "stem_length": 6}),
+    ("char_wb_2_4", {"text_analyzer": "char_wb", "ngram_range": [2, 4], "max_features": 20000}),
+    ("hashing", {"text_hashing": True}),
+]
+
+
+def _matrix_mb(X):
+    return round((X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 2 ** 20, 2)
+
+
+def bench_features(rows, delta_share=0.1, seed=42):
+    """Векторизация текста: скорость (док/с) и память матрицы признаков
+
+    Для каждой настройки - обучение "с нуля" и переобучение после добавления новой порции
+    (delta_share записей): счетчики токенов старых блоков берутся из кэша хранилища.
+    Для сравнения - прежний путь: TfidfVectorizer.fit_transform по всем текстам.
+    """
+    records = generate_records(rows, seed)
+    delta_size = int(len(records) * delta_share)
+    base, delta = records[:len(records) - delta_size], records[len(records) - delta_size:]
+    texts = [record['full_text'] for record in base + delta]
+
+    reference = TfidfVectorizer(max_features=1500, stop_words=text_features.STOP_WORDS)
+    X, elapsed = _timed(reference.fit_transform, texts)
+    results = [{"name": "sklearn_fit_transform", "docs": len(texts), "fit_docs_per_s": round(len(texts) / elapsed),
+                "matrix_mb": _matrix_mb(X), "features": X.shape[1]}]
+
+    for name, extra in FEATURE_CONFIGS:
+        config = {**DEFAULT_MODEL_CONFIG, **extra}
+        store = RecordStore(base)
+        _, cold_time = _timed(text_features.fit_transform, text_features.create_vectorizer(config), store)
+        store.append(delta)
+        X, warm_time = _timed(text_features.fit_transform, text_features.create_vectorizer(config), store)
+        report = {
+            "name": name,
+            "model_config": extra,
+            "docs": len(store),
+            "fit_docs_per_s": round(len(base) / cold_time),
+            "refit_after_delta_docs_per_s": round(len(store) / warm_time),
+            "refit_after_delta_s": round(warm_time, 3),
+            "matrix_mb": _matrix_mb(X),
+            "features": X.shape[1],
+            "token_cache_mb": store.get_info()["cache_mb"],
+        }
+        results.append(report)
+        print(f"📊 {name}: {report['fit_docs_per_s']} док/с с нуля, {report['refit_after_delta_docs_per_s']} "
+              f"док/с при переобучении, матрица {report['matrix_mb']} МБ, кэш {report['token_cache_mb']} МБ")
+    return results
+
+
+def _folder_size(folder):
+    """Суммарный размер файлов в папке, байт"""
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+
+def _drop_ingestion_state(folder):
+    """Убрать из папки модели сохраненные записи загрузки: сравниваются только артефакты модели"""
+    for name in (INGESTION_RECORDS_FILE, INGESTION_MANIFEST_FILE):
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _latency_percentiles(func, calls):
+    """p50/p95/p99 времени вызова func() в миллисекундах"""
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        "p99_ms": round(float(np.percentile(timings, 99)), 3),
+    }
+
+
+def _model_report(name, model_config, train, test, latency_calls=200):
+    """Обучение одной конфигурации: время, размер на диске, задержка predict и точность"""
+    manager = ModelManager(model_config=model_config)
+    manager.prediction_cache.max_size = 0  # Измеряем модель, а не кэш предсказаний
+    train_time = _train_on(manager, train)
+    with tempfile.TemporaryDirectory() as folder:
+        _timed(manager.save_model, folder)
+        _drop_ingestion_state(folder)
+        model_size = _folder_size(folder)
+
+    texts = [(record['title'], record['description']) for record in test]
+    latency = _latency_percentiles(lambda i: manager.predict(*texts[i % len(texts)]), latency_calls)
+    return {
+        "model": name,
+        "model_config": model_config,
+        "train_s": round(train_time, 3),
+        "model_size_mb": round(model_size / 2 ** 20, 2),
+        "predict_latency": latency,
+        "accuracy": _heads_accuracy(manager, test),
+    }
+
+
+# Наборы конфигураций модели для сравнения
+MODEL_SUITES = {
+    "heads": [
+        ("three_forests", {}),
+        ("multi_output_forest", {"multi_output": True}),
+        ("linear_heads_sgd", {"classifier": "sgd"}),
+    ],
+    "backends": [
+        ("random_forest", {"classifier": "random_forest"}),
+        ("sgd", {"classifier": "sgd"}),
+        ("logistic_regression", {"classifier": "logistic_regression"}),
+        ("linear_svc", {"classifier": "linear_svc"}),
+    ],
+}
+
+
+def bench_models(suite, rows, test_share=0.1, seed=42):
+    """Сравнение конфигураций модели из MODEL_SUITES[suite] на одной выборке"""
+    records = generate_records(rows, seed)
+    split = len(records) - int(len(records) * test_share)
+    train, test = records[:split], records[split:]
+
+    results = []
+    for name, model_config in MODEL_SUITES[suite]:
+        report = _model_report(name, model_config, train, test)
+        results.append(report)
+        print(f"📊 {name}: обучение {report['train_s']}s, модель {report['model_size_mb']} МБ, "
+              f"predict p50 {report['predict_latency']['p50_ms']} мс / p99 {report['predict_latency']['p99_ms']} мс")
+    return results
+
+
+# Загрузка модели в отдельном процессе: время и память (RssAnon - собственная, RssFile - mmap файлов)
+_LOAD_PROBE = """
+import json, sys, time, io, contextlib
+sys.path.insert(0, {repo!r})
+from model_manager import ModelManager
+
+def rss():
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return {{name: int(fields[name].split()[0]) for name in ("VmRSS", "RssAnon", "RssFile")}}
+
+manager = ModelManager()
+before = rss()
+with contextlib.redirect_stdout(io.StringIO()):
+    start = time.perf_counter()
+    manager.load_model({folder!r}, **{kwargs!r})
+    load_time = time.perf_counter() - start
+    manager.predict("Не работает принтер", "в кабинете 305")
+after = rss()
+print(json.dumps({{"load_s": load_time, **{{name + "_mb": (after[name] - before[name]) / 1024 for name in after}}}}))
+"""
+
+
+def _save_legacy(manager, folder):
+    """Прежний формат: отдельный несжатый .joblib на каждый компонент"""
+    os.makedirs(folder, exist_ok=True)
+    for name, model in manager._model_snapshot().items():
+        joblib.dump(model, os.path.join(folder, f"{name}.joblib"))
+    joblib.dump({'confidence_threshold': manager.confidence_threshold, 'model_config': manager.model_config},
+                os.path.join(folder, "config.joblib"))
+
+
+def _probe_load(folder, **kwargs):
+    """Загрузить модель в чистом процессе и вернуть время и прирост памяти"""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    code = _LOAD_PROBE.format(repo=repo, folder=folder, kwargs=kwargs)
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", code],
+                            capture_output=True, text=True, check=True).stdout
+    return {name: round(value, 3) for name, value in json.loads(output.strip().splitlines()[-1]).items()}
+
+
+def bench_artifact(rows, seed=42):
+    """Прежний формат (7 файлов) против бандла с манифестом: размер, время загрузки, память"""
+    records = generate_records(rows, seed)
+    results = []
+    for name, model_config in [("random_forest", {}), ("logistic_regression", {"classifier": "logistic_regression"})]:
+        manager = ModelManager(model_config=model_config)
+        _train_on(manager, records)
+        with tempfile.TemporaryDirectory() as folder:
+            legacy, bundle, compressed = (os.path.join(folder, sub) for sub in ("legacy", "bundle", "compressed"))
+            _save_legacy(manager, legacy)
+            _timed(manager.save_model, bundle)
+            _timed(manager.save_model, compressed, compress=3)
+            _drop_ingestion_state(bundle)
+            _drop_ingestion_state(compressed)
+
+            for variant, path, kwargs in [
+                ("legacy_files", legacy, {}),
+                ("bundle_mmap", bundle, {"mmap_mode": "r"}),
+                ("bundle_no_mmap", bundle, {"mmap_mode": None}),
+                ("bundle_compressed", compressed, {}),
+            ]:
+                report = {"model": name, "format": variant, "size_mb": round(_folder_size(path) / 2 ** 20, 2),
+                          **_probe_load(path, **kwargs)}
+                results.append(report)
+                print(f"📊 {name} / {variant}: {report['size_mb']} МБ, загрузка {report['load_s']}s, "
+                      f"RssAnon +{report['RssAnon_mb']} МБ, RssFile +{report['RssFile_mb']} МБ")
+    return results
+
+
+def _concurrent_load(predict, records, concurrency):
+    """Прогнать записи через predict из concurrency потоков: пропускная способность и задержки"""
+    def call(record):
+        start = time.perf_counter()
+        predict(record['title'], record['description'])
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        start = time.perf_counter()
+        timings = list(pool.map(call, records))
+        elapsed = time.perf_counter() - start
+    return {
+        "throughput_rps": round(len(records) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p99_ms": round(float(np.percentile(timings, 99)), 3),
+    }
+
+
+def bench_microbatch(rows, requests, concurrency_list, max_batch_size=32, max_wait_ms=5, seed=42,
+                     model_config=None):
+    """Прямые вызовы predict против микро-батчинга при разном числе одновременных запросов"""
+    records = generate_records(rows, seed)
+    manager = ModelManager(model_config=model_config)
+    manager.prediction_cache.max_size = 0
+    _train_on(manager, records)
+    batcher = MicroBatcher(manager, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    load = (records * (requests // len(records) + 1))[:requests]
+
+    results = []
+    for concurrency in concurrency_list:
+        direct = _concurrent_load(manager.predict, load, concurrency)
+        batched = _concurrent_load(batcher.predict, load, concurrency)
+        results.append({"concurrency": concurrency, "direct": direct, "micro_batched": batched})
+        print(f"📊 {concurrency} потоков: напрямую {direct['throughput_rps']} req/s (p99 {direct['p99_ms']} мс), "
+              f"пачками {batched['throughput_rps']} req/s (p99 {batched['p99_ms']} мс)")
+    return results
+
+
+def bench_gunicorn(rows, requests, concurrency_list, workers=1, threads=None, seed=42, model_config=None):
+    """/predict через продакшн-запуск (gunicorn.conf.py): без микро-батчинга и с ним
+
+    Клиенты - concurrency потоков с HTTP-запросами; сервер - gunicorn с теми же настройками,
+    что в продакшне (workers, threads и MICRO_BATCH_* берутся из окружения, как в gunicorn.conf.py).
+    """
+    records = generate_records(rows, seed)
+    load = (records * (requests // len(records) + 1))[:requests]
+    repo = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        manager = ModelManager(model_config=model_config)
+        _train_on(manager, records)
+        _timed(manager.save_model, os.path.join(folder, "model"))
+
+        for micro_batching in ("0", "1"):
+            env = dict(os.environ, WEB_CONCURRENCY=str(workers), MICRO_BATCHING=micro_batching,
+                       PREDICTION_CACHE_SIZE="0", TRAINING_STATE_DIR=os.path.join(folder, "jobs"),
+                       PYTHONPATH=repo, MODEL_CONFIG=json.dumps(model_config or {}))
+            if threads:
+                env["GUNICORN_THREADS"] = str(threads)
+            with _gunicorn_server(repo, folder, env) as url:
+                for concurrency in concurrency_list:
+                    before = _batching_stats(url)
+                    report = _concurrent_load(lambda title, description: _post_predict(url, title, description),
+                                              load, concurrency)
+                    after = _batching_stats(url)
+                    batches = after.get("batches", 0) - before.get("batches", 0)
+                    items = after.get("items", 0) - before.get("items", 0)
+                    results.append({"micro_batching": micro_batching == "1", "concurrency": concurrency,
+                                    "workers": workers, **report,
+                                    "max_batch_size": after.get("max_batch_size"),
+                                    "avg_batch_size": round(items / batches, 2) if batches else None})
+                    print(f"📊 gunicorn, микро-батчинг {'вкл' if micro_batching == '1' else 'выкл'}, "
+                          f"{concurrency} клиентов: {report['throughput_rps']} req/s (p99 {report['p99_ms']} мс)")
+    return results
+
+
+@contextlib.contextmanager
+def _gunicorn_server(repo, folder, env):
+    """gunicorn -c gunicorn.conf.py wsgi:app в папке folder; возвращает адрес сервера"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(env, PORT=str(port))
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", os.path.join(repo, "gunicorn.conf.py"),
+                                "--chdir", folder, "wsgi:app"],
+                               env=env, cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(600):
+            try:
+                with urllib.request.urlopen(f"{url}/health", timeout=1):
+                    break
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError("gunicorn завершился при запуске")
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("gunicorn не ответил за 60 с")
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _post_predict(url, title, description):
+    body = json.dumps({"title": title, "description": description}).encode()
+    request = urllib.request.Request(f"{url}/predict", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def _batching_stats(url):
+    """Статистика микро-батчинга воркера, ответившего на /stats (с одним воркером - всего сервера)"""
+    with urllib.request.urlopen(f"{url}/stats") as response:
+        return json.load(response)["micro_batching"]
+
+
+def _peak_rss_mb():
+    """Пиковая резидентная память текущего процесса, МБ (ru_maxrss в Linux - в КБ)"""
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _stage_latencies(manager, texts, calls):
+    """Задержка отдельных этапов predict для одной заявки"""
+    models = manager._model_snapshot()
+    vectorized = [models["vectorizer"].transform([text]) for text in texts]
+    pick = lambda i: i % len(texts)
+
+    stages = {
+        "spam_check": lambda i: manager.spam_protector.is_spam(texts[pick(i)], ""),
+        "vectorize": lambda i: models["vectorizer"].transform([texts[pick(i)]]),
+    }
+    if models["shared_classifier"] is not None:
+        stages["shared_classifier"] = lambda i: models["shared_classifier"].predict_proba(vectorized[pick(i)])
+    else:
+        for _, _, name in HEADS:
+            stages[name] = lambda i, name=name: predict_proba(models[name], vectorized[pick(i)])
+    return {stage: _latency_percentiles(func, calls) for stage, func in stages.items()}
+
+
+def bench_scale(rows, seed=42, model_config=None, xlsx=True, files=1, latency_calls=500,
+                batch_size=100, batch_calls=50):
+    """Полный прогон сервиса на одном объеме данных
+
+    Загрузка xlsx через DataLoader, обучение, размер модели, задержки predict
+    (одиночный, пакетный и по этапам) и пиковая память процесса.
+    Пиковая память не уменьшается, поэтому каждый объем нужно мерить в отдельном процессе.
+    """
+    report = {"rows": rows, "model_config": model_config or {}}
+    manager = ModelManager(model_config=model_config)
+    manager.prediction_cache.max_size = 0  # Измеряем модель, а не кэш предсказаний
+
+    with tempfile.TemporaryDirectory() as folder:
+        if xlsx:
+            _, report["write_xlsx_s"] = _timed(write_workbooks, folder, rows, files, seed)
+            report["xlsx_size_mb"] = round(_folder_size(folder) / 2 ** 20, 2)
+            manager.data_loader = DataLoader(cache_dir=None)
+            _, report["load_from_excel_s"] = _timed(manager.data_loader.load_from_excel, folder)
+            records = manager.data_loader.historical_data
+        else:
+            records, report["generate_s"] = _timed(generate_records, rows, seed)
+        report["records"] = len(records)
+        report["peak_rss_after_load_mb"] = _peak_rss_mb()
+
+        report["train_s"] = _train_on(manager, records)
+        report["peak_rss_after_train_mb"] = _peak_rss_mb()
+
+        model_folder = os.path.join(folder, "model")
+        _, report["save_s"] = _timed(manager.save_model, model_folder)
+        report["model_size_mb"] = round(os.path.getsize(os.path.join(model_folder, MODEL_BUNDLE_FILE)) / 2 ** 20, 2)
+        report["ingestion_state_mb"] = round(os.path.getsize(os.path.join(model_folder, INGESTION_RECORDS_FILE))
+                                             / 2 ** 20, 2)
+
+    sample = records[-min(len(records), 1000):]
+    items = [{"title": record['title'], "description": record['description']} for record in sample]
+    texts = [record['full_text'] for record in sample]
+
+    report["predict_latency"] = _latency_percentiles(lambda i: manager.predict(**items[i % len(items)]),
+                                                     latency_calls)
+    batches = [[items[(i * batch_size + j) % len(items)] for j in range(batch_size)] for i in range(batch_calls)]
+    batch_latency = _latency_percentiles(lambda i: manager.predict_batch(batches[i]), batch_calls)
+    report["predict_batch_latency"] = {
+        "batch_size": batch_size,
+        **batch_latency,
+        "items_per_s": round(batch_size / batch_latency["p50_ms"] * 1000, 1),
+    }
+    report["stage_latency"] = _stage_latencies(manager, texts, latency_calls)
+    report["peak_rss_mb"] = _peak_rss_mb()
+
+    for name, value in report.items():
+        if isinstance(value, float) and name.endswith("_s"):
+            report[name] = round(value, 3)
+    return report
+
+
+def _environment():
+    """Окружение прогона, чтобы результаты разных запусков можно было сравнивать"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "sklearn": sklearn.__version__,
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _scale_in_subprocess(rows, seed=42, model_config=None, xlsx=True, files=1):
+    """bench_scale в отдельном процессе (чистая пиковая память)"""
+    command = [sys.executable, "-W", "ignore", os.path.abspath(__file__), "scale", "--rows", str(rows),
+               "--seed", str(seed), "--files", str(files), "--model-config", json.dumps(model_config or {}),
+               "--quiet"]
+    if not xlsx:
+        command.append("--no-xlsx")
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)[0]
+
+
+def bench_suite(rows_list, seed=42, model_config=None, xlsx=True, files=1):
+    """bench_scale для каждого объема в отдельном процессе (чистая пиковая память)"""
+    results = []
+    for rows in rows_list:
+        report = _scale_in_subprocess(rows, seed, model_config, xlsx, files)
+        results.append(report)
+        print(f"📊 {rows} строк: загрузка {report.get('load_from_excel_s', report.get('generate_s'))}s, "
+              f"обучение {report['train_s']}s, модель {report['model_size_mb']} МБ, "
+              f"predict p50/p95/p99 {report['predict_latency']['p50_ms']}/{report['predict_latency']['p95_ms']}/"
+              f"{report['predict_latency']['p99_ms']} мс, пик памяти {report['peak_rss_mb']} МБ")
+    return results
+
+
+# Настройки обучения леса для сравнения (поверх DEFAULT_MODEL_CONFIG)
+FOREST_CONFIGS = [
+    ("default", {}),
+    ("n_jobs_all", {"n_jobs": -1}),
+    ("parallel_heads", {"parallel_heads": True}),
+    ("min_leaf_2_depth_40", {"min_samples_leaf": 2, "max_depth": 40}),
+    ("max_samples_0.5", {"max_samples": 0.5}),
+    ("combined", {"n_jobs": -1, "parallel_heads": True, "min_samples_leaf": 2, "max_samples": 0.5}),
+]
+
+
+def bench_forest(rows, seed=42):
+    """Обучение леса с разными настройками: время, пиковая память, размер модели и задержка predict
+
+    Каждая настройка обучается в отдельном процессе на синтетических записях (без xlsx).
+    """
+    results = []
+    for name, model_config in FOREST_CONFIGS:
+        scale_report = _scale_in_subprocess(rows, seed, model_config, xlsx=False)
+        report = {
+            "name": name,
+            "model_config": model_config,
+            "records": scale_report["records"],
+            "train_s": scale_report["train_s"],
+            "train_peak_rss_mb": scale_report["peak_rss_after_train_mb"],
+            "train_rss_growth_mb": round(scale_report["peak_rss_after_train_mb"]
+                                         - scale_report["peak_rss_after_load_mb"], 1),
+            "model_size_mb": scale_report["model_size_mb"],
+            "predict_p50_ms": scale_report["predict_latency"]["p50_ms"],
+            "predict_p99_ms": scale_report["predict_latency"]["p99_ms"],
+        }
+        results.append(report)
+        print(f"📊 {name}: обучение {report['train_s']}s, пик памяти {report['train_peak_rss_mb']} МБ "
+              f"(+{report['train_rss_growth_mb']} МБ), модель {report['model_size_mb']} МБ, "
+              f"predict p50 {report['predict_p50_ms']} мс")
+    return results
+
+
+def _flatten(report, prefix=""):
+    """Числовые метрики отчета в виде {"путь.к.метрике": значение}"""
+    metrics = {}
+    for name, value in report.items():
+        key = f"{prefix}{name}"
+        if isinstance(value, dict):
+            metrics.update(_flatten(value, key + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[key] = value
+    return metrics
+
+
+def compare_runs(baseline_path, current_path, threshold=0.1):
+    """Сравнение двух JSON отчетов suite: изменение каждой метрики по объемам"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {report["rows"]: report for report in json.load(f)["results"]}
+    with open(current_path, encoding="utf-8") as f:
+        current = {report["rows"]: report for report in json.load(f)["results"]}
+
+    results = []
+    for rows in sorted(baseline.keys() & current.keys()):
+        before, after = _flatten(baseline[rows]), _flatten(current[rows])
+        for metric in sorted(before.keys() & after.keys()):
+            if metric in ("rows", "records") or not before[metric]:
+                continue
+            change = (after[metric] - before[metric]) / before[metric]
+            results.append({"rows": rows, "metric": metric, "baseline": before[metric],
+                            "current": after[metric], "change": round(change, 3)})
+            if abs(change) >= threshold:
+                print(f"{'🔺' if change > 0 else '🔻'} {rows} строк, {metric}: "
+                      f"{before[metric]} -> {after[metric]} ({change:+.0%})")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки сервиса классификации заявок")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Парсинг Excel выгрузок")
+    ingest.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    ingest.add_argument("--seed", type=int, default=42)
+    ingest.add_argument("--files", type=int, default=1, help="На сколько xlsx разбить выгрузку")
+    ingest.add_argument("--workers", type=int, default=os.cpu_count(), help="Процессов для параллельной загрузки")
+    ingest.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    incremental = subparsers.add_parser("incremental", help="Инкрементальное дообучение против полного")
+    incremental.add_argument("--rows", type=int, default=20000)
+    incremental.add_argument("--delta-share", type=float, default=0.1)
+    incremental.add_argument("--seed", type=int, default=42)
+    incremental.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    for suite, help_text in [("heads", "Три леса против общей модели на все головы"),
+                             ("backends", "Сравнение классификаторов")]:
+        models = subparsers.add_parser(suite, help=help_text)
+        models.add_argument("--rows", type=int, default=20000)
+        models.add_argument("--seed", type=int, default=42)
+        models.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    features = subparsers.add_parser("features", help="Векторизация текста: док/с и память матрицы")
+    features.add_argument("--rows", type=int, default=100000)
+    features.add_argument("--delta-share", type=float, default=0.1)
+    features.add_argument("--seed", type=int, default=42)
+    features.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    forest = subparsers.add_parser("forest", help="Настройки обучения леса: время, память, размер модели")
+    forest.add_argument("--rows", type=int, default=100000)
+    forest.add_argument("--seed", type=int, default=42)
+    forest.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    artifact = subparsers.add_parser("artifact", help="Формат сохраненной модели: размер, загрузка, память")
+    artifact.add_argument("--rows", type=int, default=20000)
+    artifact.add_argument("--seed", type=int, default=42)
+    artifact.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    microbatch = subparsers.add_parser("microbatch", help="Микро-батчинг запросов /predict")
+    microbatch.add_argument("--rows", type=int, default=5000)
+    microbatch.add_argument("--requests", type=int, default=2000)
+    microbatch.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    microbatch.add_argument("--max-batch-size", type=int, default=32)
+    microbatch.add_argument("--max-wait-ms", type=float, default=5)
+    microbatch.add_argument("--classifier", default="random_forest")
+    microbatch.add_argument("--seed", type=int, default=42)
+    microbatch.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    gunicorn = subparsers.add_parser("gunicorn", help="/predict через gunicorn.conf.py: HTTP-нагрузка")
+    gunicorn.add_argument("--rows", type=int, default=5000)
+    gunicorn.add_argument("--requests", type=int, default=2000)
+    gunicorn.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    gunicorn.add_argument("--workers", type=int, default=1)
+    gunicorn.add_argument("--threads", type=int, help="GUNICORN_THREADS (по умолчанию - как в gunicorn.conf.py)")
+    gunicorn.add_argument("--classifier", default="random_forest")
+    gunicorn.add_argument("--seed", type=int, default=42)
+    gunicorn.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    suite = subparsers.add_parser("suite", help="Полный прогон на нескольких объемах (каждый в своем процессе)")
+    suite.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000])
+    suite.add_argument("--files", type=int, default=1, help="На сколько xlsx разбить выгрузку")
+    suite.add_argument("--no-xlsx", action="store_true", help="Не писать xlsx, генерировать записи в памяти")
+    suite.add_argument("--model-config", type=json.loads, default={}, help="MODEL_CONFIG в формате JSON")
+    suite.add_argument("--seed", type=int, default=42)
+    suite.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    scale = subparsers.add_parser("scale", help="Полный прогон на одном объеме в текущем процессе")
+    scale.add_argument("--rows", type=int, default=10000)
+    scale.add_argument("--files", type=int, default=1)
+    scale.add_argument("--no-xlsx", action="store_true")
+    scale.add_argument("--model-config", type=json.loads, default={})
+    scale.add_argument("--seed", type=int, default=42)
+    scale.add_argument("--quiet", action="store_true", help="Выводить только JSON")
+    scale.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    compare = subparsers.add_parser("compare", help="Сравнить два JSON отчета suite")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.1, help="Показывать изменения от этой доли")
+    compare.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        results = bench_ingest(args.rows, args.seed, args.files, args.workers)
+    elif args.command == "incremental":
+        results = bench_incremental(args.rows, args.delta_share, seed=args.seed)
+    elif args.command == "suite":
+        results = bench_suite(args.rows, args.seed, args.model_config, not args.no_xlsx, args.files)
+    elif args.command == "scale":
+        results = [bench_scale(args.rows, args.seed, args.model_config, not args.no_xlsx, args.files)]
+        if args.quiet:
+            print(json.dumps(results, ensure_ascii=False))
+            return
+    elif args.command == "compare":
+        results = compare_runs(args.baseline, args.current, args.threshold)
+    elif args.command == "microbatch":
+        results = bench_microbatch(args.rows, args.requests, args.concurrency, args.max_batch_size,
+                                   args.max_wait_ms, args.seed, {"classifier": args.classifier})
+    elif args.command == "gunicorn":
+        results = bench_gunicorn(args.rows, args.requests, args.concurrency, args.workers, args.threads,
+                                 args.seed, {"classifier": args.classifier})
+    elif args.command == "artifact":
+        results = bench_artifact(args.rows, seed=args.seed)
+    elif args.command == "forest":
+        results = bench_forest(args.rows, seed=args.seed)
+    elif args.command == "features":
+        results = bench_features(args.rows, args.delta_share, seed=args.seed)
+    elif args.command in MODEL_SUITES:
+        results = bench_models(args.command, args.rows, seed=args.seed)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"command": args.command, "environment": _environment(), "results": results},
+                      f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
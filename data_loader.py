@@ -1,83 +1,107 @@
 import pandas as pd
+import numpy as np
 import os
 import glob
+import time
 from datetime import datetime
 import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import openpyxl
+from openpyxl.cell.cell import ERROR_CODES
+from pandas.io.parsers import TextParser
+import joblib
+import json
+from excel_cache import ExcelCache, file_hash
+from record_store import RecordStore
+from metrics import registry
+
+# Столбцы выгрузки: обязательные и поля записи, которые из них заполняются
+REQUIRED_COLUMNS = ['Заголовок', 'Назначенный эксперт Имя', 'Группа экспертов Имя']
+OPTIONAL_TEXT_COLUMNS = {
+    'description': 'Описание',
+    'label': 'Предложение Отображаемая метка',
+    'url': 'URL',
+}
+RECORD_FIELDS = ['code', 'close_time', 'title', 'expert', 'description',
+                 'group', 'label', 'url', 'full_text', 'source_file']
+# Столбцы, которые читаются при потоковой загрузке
+STREAM_COLUMNS = ['Код', 'Время закрытия'] + REQUIRED_COLUMNS + list(OPTIONAL_TEXT_COLUMNS.values())
+STREAM_CHUNK_ROWS = 20000  # Строк в одной порции потокового чтения
+STREAM_PROGRESS_SECONDS = 5  # Как часто печатать скорость потокового чтения
+# Состояние загрузки, сохраняемое рядом с моделью
+INGESTION_MANIFEST_FILE = "ingestion.json"
+INGESTION_RECORDS_FILE = "records.joblib"
+INGESTION_FORMAT_VERSION = 1
+
 
 class DataLoader:
-    def __init__(self):
-        self.historical_data = []
-        self.groups = set()
-        self.experts = set()
-        self.labels = set()
+    def __init__(self, cache_dir="cache/excel", workers=None, streaming_min_mb=None):
+        # Колоночное хранилище заявок: новые загрузки в логическом порядке идут первыми
+        self.historical_data = RecordStore()
         self.loaded_files = set()  # Для отслеживания уже загруженных файлов
+        # Манифест загрузки: путь -> размер, mtime, хэш содержимого и число записей файла
+        self.file_manifest = {}
+        self.last_load_info = {"added": 0, "removed": 0}
+        # Кэш прочитанных выгрузок на диске (None - всегда читать xlsx)
+        self.excel_cache = ExcelCache(cache_dir) if cache_dir else None
+        # Число процессов для параллельного чтения файлов (1 - последовательно)
+        self.workers = workers if workers is not None else int(os.environ.get('EXCEL_LOAD_WORKERS', 1))
+        # Файлы от этого размера (МБ) читаются потоково с ограниченной памятью
+        # (0 - все файлы; EXCEL_STREAMING_MIN_MB=off - никогда)
+        if streaming_min_mb is None and os.environ.get('EXCEL_STREAMING_MIN_MB') != 'off':
+            streaming_min_mb = float(os.environ.get('EXCEL_STREAMING_MIN_MB', 20))
+        self.streaming_min_mb = streaming_min_mb
     
-    def load_from_excel(self, folder_path="Выгрузка"):
-        """Загрузка данных из всех xlsx файлов в папке, игнорируя уже загруженные"""
+    def load_from_excel(self, folder_path="Выгрузка", workers=None):
+        """Загрузка данных из всех xlsx файлов в папке, игнорируя уже загруженные
+        
+        workers > 1 - читать файлы параллельно в пуле процессов (по умолчанию self.workers).
+        Файлы больше streaming_min_mb читаются потоково порциями (см. _stream_file).
+        """
+        workers = workers or self.workers
         try:
-            excel_files = glob.glob(os.path.join(folder_path, "*.xlsx"))
+            start_time = time.perf_counter()
+            excel_files = list_excel_files(folder_path)
+            if self.excel_cache:
+                self.excel_cache.prune_missing()
             
             if not excel_files:
                 print(f"❌ В папке '{folder_path}' не найдено xlsx файлов")
                 return False
             
-            # Фильтруем файлы, оставляем только новые
-            new_files = [f for f in excel_files if f not in self.loaded_files]
+            # Фильтруем файлы, оставляем только новые и изменившиеся
+            new_files = self.pending_files(excel_files)
+            self.last_load_info = {"added": 0, "removed": 0}
             
             if not new_files:
                 print(f"ℹ️ Все файлы в папке '{folder_path}' уже загружены")
                 return True
                 
-            print(f"📁 Найдено {len(excel_files)} файлов, из них {len(new_files)} новых")
-            
-            all_data = []
+            print(f"📁 Найдено {len(excel_files)} файлов, из них {len(new_files)} новых или измененных")
             
+            # Записи перечитываемых файлов заменяются, а не дублируются
+            removed = self.historical_data.remove('source_file', {os.path.basename(f) for f in new_files})
             for file_path in new_files:
-                print(f"📖 Чтение файла: {os.path.basename(file_path)}")
-                
-                try:
-                    # Читаем Excel, пропускаем пустые строки
-                    df = pd.read_excel(file_path).dropna(how='all')
-                    
-                    if df.empty:
-                        print(f"⚠️ Файл {os.path.basename(file_path)} пустой")
-                        self.loaded_files.add(file_path)  # Все равно отмечаем как загруженный
-                        continue
-                    
-                    # Проверяем наличие нужных столбцов
-                    required_columns = ['Заголовок', 'Назначенный эксперт Имя', 'Группа экспертов Имя']
-                    missing_columns = [col for col in required_columns if col not in df.columns]
-                    
-                    if missing_columns:
-                        print(f"⚠️ В файле {os.path.basename(file_path)} отсутствуют столбцы: {missing_columns}")
-                        print(f"   Найдены столбцы: {list(df.columns)}")
-                        self.loaded_files.add(file_path)  # Все равно отмечаем как загруженный
-                        continue
-                    
-                    file_records = 0
-                    for _, row in df.iterrows():
-                        record = self._parse_excel_row(row, file_path)
-                        if record:
-                            all_data.append(record)
-                            self.groups.add(record['group'])
-                            self.experts.add(record['expert'])
-                            self.labels.add(record['label'])
-                            file_records += 1
-                    
-                    # Добавляем файл в список загруженных только если успешно обработали
-                    self.loaded_files.add(file_path)
-                    print(f"✅ Файл {os.path.basename(file_path)}: добавлено {file_records} записей")
-                            
-                except Exception as e:
-                    print(f"⚠️ Ошибка чтения {file_path}: {e}")
-                    continue
+                self.loaded_files.discard(file_path)
+                self.file_manifest.pop(file_path, None)
+            if removed:
+                print(f"🔄 Удалено {removed} прежних записей перечитываемых файлов")
+            
+            # Порции записей сразу переводятся в столбцы хранилища и добавляются
+            # одним блоком (в логическом порядке - сверху старых)
+            added = self.historical_data.extend(self._iter_file_records(new_files, workers))
+            self.last_load_info = {"added": added, "removed": removed}
             
-            if all_data:
-                # Добавляем новые данные в начало (сверху старых)
-                self.historical_data = all_data + self.historical_data
-                print(f"✅ Загружено {len(all_data)} новых записей из {len(new_files)} файлов")
+            if added:
+                registry.observe("stage_duration_seconds", time.perf_counter() - start_time,
+                                 operation="load_excel", stage="total")
+                print(f"✅ Загружено {added} новых записей из {len(new_files)} файлов")
                 print(f"📊 Всего записей: {len(self.historical_data)}")
-                print(f"📊 Обнаружено: {len(self.groups)} групп, {len(self.experts)} экспертов, {len(self.labels)} меток")
+                stats = self.get_stats()
+                print(f"📊 Обнаружено: {stats['groups_count']} групп, {stats['experts_count']} экспертов, "
+                      f"{stats['labels_count']} меток")
                 
                 # Выводим примеры данных для проверки
                 self.print_sample_data(5)
@@ -88,9 +112,178 @@ class DataLoader:
                 return False
                 
         except Exception as e:
+            registry.inc("errors_total", operation="load_excel")
             print(f"❌ Ошибка загрузки данных: {e}")
             return False
 
+    def _iter_file_records(self, new_files, workers):
+        """Порции записей новых файлов в порядке new_files
+        
+        Большие файлы читаются потоково в этом процессе, остальные - целиком
+        (при workers > 1 - параллельно в пуле процессов). Порядок записей не зависит
+        от способа чтения.
+        """
+        streamed = {f for f in new_files if self._should_stream(f)}
+        pooled = [f for f in new_files if f not in streamed]
+        if workers <= 1 or len(pooled) <= 1:
+            pooled = []
+        
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) if pooled else nullcontext() as pool:
+            futures = {}
+            if pooled:
+                print(f"⚙️ Параллельное чтение {len(pooled)} файлов в {workers} процессах")
+                cache_dir = self.excel_cache.cache_dir if self.excel_cache else None
+                futures = {f: pool.submit(_load_file_in_worker, f, cache_dir) for f in pooled}
+            
+            for file_path in new_files:
+                if file_path in streamed:
+                    yield from self._stream_file(file_path)
+                    continue
+                
+                try:
+                    if file_path in futures:
+                        records, cache_state = futures[file_path].result()
+                        if self.excel_cache and cache_state:
+                            self.excel_cache.apply_entry_state(cache_state)
+                    else:
+                        print(f"📖 Чтение файла: {os.path.basename(file_path)}")
+                        records = self._load_file(file_path)
+                except Exception as e:
+                    registry.inc("errors_total", operation="load_excel_file")
+                    print(f"⚠️ Ошибка чтения {file_path}: {e}")
+                    continue
+                
+                # Пустые файлы и файлы без нужных столбцов (records is None) тоже отмечаем как загруженные
+                self._mark_loaded(file_path, len(records) if records is not None else 0)
+                if records is not None:
+                    print(f"✅ Файл {os.path.basename(file_path)}: добавлено {len(records)} записей")
+                    yield records
+    
+    def _load_file(self, file_path):
+        """Чтение и парсинг одного файла. Возвращает список записей или None, если файл пропущен"""
+        # Читаем Excel (или его копию из кэша), пропускаем пустые строки
+        with registry.timer("load_excel", "read"):
+            df = self._read_excel(file_path)
+        
+        if df.empty:
+            print(f"⚠️ Файл {os.path.basename(file_path)} пустой")
+            return None
+        
+        # Проверяем наличие нужных столбцов
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+        
+        if missing_columns:
+            print(f"⚠️ В файле {os.path.basename(file_path)} отсутствуют столбцы: {missing_columns}")
+            print(f"   Найдены столбцы: {list(df.columns)}")
+            return None
+        
+        with registry.timer("load_excel", "parse"):
+            return self._parse_excel_frame(df, file_path)
+    
+    def _should_stream(self, file_path):
+        """Читать ли файл потоково (по размеру файла)"""
+        if self.streaming_min_mb is None:
+            return False
+        return os.path.getsize(file_path) >= self.streaming_min_mb * 2 ** 20
+    
+    def _stream_file(self, file_path, chunk_rows=STREAM_CHUNK_ROWS):
+        """Потоковое чтение xlsx: порции записей по chunk_rows строк
+        
+        Лист читается openpyxl в режиме read-only строка за строкой, в памяти одновременно
+        только одна порция строк, поэтому память не зависит от размера файла. Значения ячеек
+        приводятся так же, как в pd.read_excel, и каждая порция разбирается тем же
+        _parse_excel_frame. Кэш выгрузок (целые DataFrame) для таких файлов не используется.
+        """
+        name = os.path.basename(file_path)
+        print(f"📖 Потоковое чтение файла: {name}")
+        start_time = time.perf_counter()
+        last_report = start_time
+        rows_read = data_rows = records_count = 0
+        
+        try:
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        except Exception as e:
+            registry.inc("errors_total", operation="load_excel_file")
+            print(f"⚠️ Ошибка чтения {file_path}: {e}")
+            return
+        
+        try:
+            sheet = workbook.worksheets[0]
+            # В выгрузках размеры листа бывают записаны неверно - как и pandas, не доверяем им
+            sheet.reset_dimensions()
+            rows = sheet.iter_rows(values_only=True)
+            header = list(next(rows, None) or [])
+            if not header:
+                print(f"⚠️ Файл {name} пустой")
+                self._mark_loaded(file_path, 0)
+                return
+            
+            missing_columns = [col for col in REQUIRED_COLUMNS if col not in header]
+            if missing_columns:
+                print(f"⚠️ В файле {name} отсутствуют столбцы: {missing_columns}")
+                print(f"   Найдены столбцы: {[col for col in header if col is not None]}")
+                self._mark_loaded(file_path, 0)
+                return
+            
+            # Нужные столбцы (при повторах имени, как и в pandas, - первый)
+            columns = [col for col in STREAM_COLUMNS if col in header]
+            positions = [header.index(col) for col in columns]
+            
+            chunk = []
+            for row in rows:
+                rows_read += 1
+                values = [_excel_value(row[i]) if i < len(row) else None for i in positions]
+                if any(value is not None for value in values):
+                    chunk.append(values)
+                    data_rows += 1
+                
+                if len(chunk) >= chunk_rows:
+                    records = self._parse_stream_chunk(columns, chunk, file_path)
+                    records_count += len(records)
+                    chunk = []
+                    yield records
+                
+                now = time.perf_counter()
+                if now - last_report >= STREAM_PROGRESS_SECONDS:
+                    last_report = now
+                    print(f"   ⏳ {name}: {rows_read} строк, {rows_read / (now - start_time):.0f} строк/с")
+            
+            if chunk:
+                records = self._parse_stream_chunk(columns, chunk, file_path)
+                records_count += len(records)
+                yield records
+            
+            self._mark_loaded(file_path, records_count)
+        except Exception as e:
+            # Уже прочитанные порции остаются в загрузке: файл отмечается загруженным,
+            # чтобы они не задвоились при следующей загрузке (перечитать - force_reload_file)
+            registry.inc("errors_total", operation="load_excel_file")
+            print(f"⚠️ Ошибка чтения {file_path} после {rows_read} строк, файл загружен частично: {e}")
+            self._mark_loaded(file_path, records_count)
+            return
+        finally:
+            workbook.close()
+        
+        seconds = time.perf_counter() - start_time
+        registry.observe("stage_duration_seconds", seconds, operation="load_excel", stage="stream")
+        if not data_rows:
+            print(f"⚠️ Файл {name} пустой")
+            return
+        print(f"✅ Файл {name}: добавлено {records_count} записей "
+              f"({rows_read} строк за {seconds:.1f} с, {rows_read / max(seconds, 1e-9):.0f} строк/с)")
+    
+    def _parse_stream_chunk(self, columns, rows, file_path):
+        """Разбор порции строк потокового чтения (вывод типов - как у pd.read_excel)"""
+        with registry.timer("load_excel", "parse"):
+            df = TextParser([columns] + rows, header=0).read()
+            return self._parse_excel_frame(df, file_path)
+    
+    def _read_excel(self, file_path):
+        """Чтение выгрузки через кэш, если он включен"""
+        if self.excel_cache:
+            return self.excel_cache.read_excel(file_path)
+        return pd.read_excel(file_path).dropna(how='all')
+
     def force_reload_file(self, file_path):
         """Принудительная перезагрузка конкретного файла"""
         if file_path in self.loaded_files:
@@ -99,20 +292,181 @@ class DataLoader:
     
     def force_reload_all(self, folder_path="Выгрузка"):
         """Принудительная перезагрузка всех файлов в папке"""
-        excel_files = glob.glob(os.path.join(folder_path, "*.xlsx"))
+        excel_files = list_excel_files(folder_path)
         for file_path in excel_files:
             if file_path in self.loaded_files:
                 self.loaded_files.remove(file_path)
         print(f"🔄 Все файлы в папке '{folder_path}' помечены для перезагрузки")
     
+    def pending_files(self, excel_files):
+        """Файлы из excel_files, которые еще не загружены или изменились после загрузки"""
+        return [f for f in excel_files if f not in self.loaded_files or self._file_changed(f)]
+    
+    def _mark_loaded(self, file_path, records_count):
+        """Отметить файл загруженным и запомнить его в манифесте"""
+        stat = os.stat(file_path)
+        self.loaded_files.add(file_path)
+        self.file_manifest[file_path] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': file_hash(file_path),
+            'records': records_count
+        }
+    
+    def _file_changed(self, file_path):
+        """Изменилось ли содержимое загруженного файла (хэш считается, только если изменились размер или mtime)"""
+        entry = self.file_manifest.get(file_path)
+        if entry is None:
+            return False
+        stat = os.stat(file_path)
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return False
+        if entry['hash'] == file_hash(file_path):
+            entry['size'], entry['mtime_ns'] = stat.st_size, stat.st_mtime_ns
+            return False
+        print(f"🔄 Файл {os.path.basename(file_path)} изменился, будет перечитан")
+        return True
+    
+    def save_state(self, folder_path):
+        """Сохранить манифест загрузки и записи рядом с моделью
+        
+        После перезапуска load_state восстанавливает их без повторного чтения выгрузок,
+        а load_from_excel читает только новые и изменившиеся файлы.
+        """
+        try:
+            os.makedirs(folder_path, exist_ok=True)
+            records_path = os.path.join(folder_path, INGESTION_RECORDS_FILE)
+            joblib.dump({"format_version": INGESTION_FORMAT_VERSION, "records": self.historical_data},
+                        records_path + ".tmp")
+            os.replace(records_path + ".tmp", records_path)
+            
+            manifest_path = os.path.join(folder_path, INGESTION_MANIFEST_FILE)
+            with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({
+                    "format_version": INGESTION_FORMAT_VERSION,
+                    "total_records": len(self.historical_data),
+                    "files": self.file_manifest
+                }, f, ensure_ascii=False, indent=2)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения данных загрузки: {e}")
+            return False
+    
+    def load_state(self, folder_path, mmap_mode="r"):
+        """Восстановить манифест загрузки и записи, сохраненные save_state"""
+        manifest_path = os.path.join(folder_path, INGESTION_MANIFEST_FILE)
+        records_path = os.path.join(folder_path, INGESTION_RECORDS_FILE)
+        if not (os.path.exists(manifest_path) and os.path.exists(records_path)):
+            return False
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["format_version"] > INGESTION_FORMAT_VERSION:
+                raise ValueError(f"Неподдерживаемая версия формата: {manifest['format_version']}")
+            # Массивы записей отображаются в память, как и массивы модели
+            records = joblib.load(records_path, mmap_mode=mmap_mode)["records"]
+            
+            self.historical_data = records
+            self.file_manifest = manifest["files"]
+            self.loaded_files = set(self.file_manifest)
+            print(f"📂 Восстановлено {len(records)} записей из {len(self.loaded_files)} файлов")
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка загрузки сохраненных данных: {e}")
+            return False
+    
+    def clear(self):
+        """Забыть все загруженные записи и файлы"""
+        self.historical_data.clear()
+        self.loaded_files = set()
+        self.file_manifest = {}
+        self.last_load_info = {"added": 0, "removed": 0}
+    
     def get_loaded_files_info(self):
         """Получить информацию о загруженных файлах"""
         return {
             "loaded_files_count": len(self.loaded_files),
             "loaded_files": [os.path.basename(f) for f in sorted(self.loaded_files)],
-            "total_records": len(self.historical_data)
+            "total_records": len(self.historical_data),
+            "cache": self.excel_cache.get_info() if self.excel_cache else {"enabled": False}
         }
 
+    def _parse_excel_frame(self, df, file_path):
+        """Векторизованный парсинг всего листа Excel целиком по столбцам
+        
+        Дает те же записи, что и построчный _parse_excel_row, но фильтрация,
+        очистка строк и проверка имени эксперта выполняются над целыми столбцами.
+        """
+        title = self._clean_text_column(df['Заголовок'])
+        expert = self._clean_text_column(df['Назначенный эксперт Имя'])
+        group = self._clean_text_column(df['Группа экспертов Имя'])
+        
+        # Обязательные поля заполнены, заголовок не пустой
+        mask = title.notna() & expert.notna() & group.notna()
+        mask &= title.str.len().gt(0).fillna(False).astype(bool)
+        
+        # Проверяем что эксперт - это ФИО (содержит пробелы и кириллицу)
+        valid_expert = self._valid_expert_name_mask(expert)
+        invalid_experts = expert[expert.notna() & ~valid_expert & title.notna()]
+        if len(invalid_experts):
+            examples = ", ".join(f"'{name}'" for name in invalid_experts.unique()[:5])
+            print(f"⚠️ Пропущено {len(invalid_experts)} записей с некорректным именем эксперта: {examples}")
+        mask &= valid_expert
+        
+        if not mask.any():
+            return []
+        
+        columns = {
+            'code': self._optional_value_column(df, 'Код', mask),
+            'close_time': self._optional_value_column(df, 'Время закрытия', mask),
+            'title': title[mask],
+            'expert': expert[mask],
+            'group': group[mask],
+        }
+        for field, column in OPTIONAL_TEXT_COLUMNS.items():
+            if column in df.columns:
+                columns[field] = self._clean_text_column(df[column])[mask].fillna("")
+            else:
+                columns[field] = pd.Series("", index=title[mask].index)
+        
+        # Объединяем заголовок и описание для обучения
+        has_description = columns['description'].str.len().gt(0)
+        columns['full_text'] = columns['title'].where(
+            ~has_description, columns['title'] + ". " + columns['description'])
+        columns['source_file'] = [os.path.basename(file_path)] * int(mask.sum())
+        
+        values = [list(columns[field]) for field in RECORD_FIELDS]
+        return [dict(zip(RECORD_FIELDS, row)) for row in zip(*values)]
+    
+    @staticmethod
+    def _clean_text_column(series):
+        """str(value).strip() для заполненных значений, NaN остаются NaN"""
+        filled = series.notna()
+        cleaned = pd.Series(np.nan, index=series.index, dtype=object)
+        if filled.any():
+            cleaned[filled] = series[filled].astype(str).str.strip().astype(object)
+        return cleaned
+    
+    @staticmethod
+    def _optional_value_column(df, column, mask):
+        """Значения необязательного столбца как есть, None для пропусков и отсутствующего столбца"""
+        if column not in df.columns:
+            return [None] * int(mask.sum())
+        values = df.loc[mask, column].astype(object)
+        return values.where(values.notna(), None)
+    
+    @staticmethod
+    def _valid_expert_name_mask(expert):
+        """Векторизованная версия _is_valid_expert_name: кириллица и минимум 2 слова"""
+        filled = expert.notna()
+        valid = pd.Series(False, index=expert.index)
+        if filled.any():
+            names = expert[filled].astype(str)
+            # После strip пробельный символ внутри строки означает минимум 2 слова
+            valid[filled] = names.str.contains(r'[а-яА-Я]', regex=True) & names.str.contains(r'\s', regex=True)
+        return valid
+    
     # Остальные методы остаются без изменений...
     def _parse_excel_row(self, row, file_path):
         """Парсинг строки Excel по фиксированным именам столбцов"""
@@ -196,24 +550,25 @@ class DataLoader:
     
     def get_groups(self):
         """Получить список всех групп"""
-        return sorted(list(self.groups))
+        return sorted(self.historical_data.unique('group'))
     
     def get_experts(self):
         """Получить список всех экспертов"""
-        return sorted(list(self.experts))
+        return sorted(self.historical_data.unique('expert'))
     
     def get_labels(self):
         """Получить список всех меток"""
-        return sorted(list(self.labels))
+        return sorted(self.historical_data.unique('label'))
     
     def get_stats(self):
         """Получить статистику данных"""
         return {
             "total_records": len(self.historical_data),
-            "groups_count": len(self.groups),
-            "experts_count": len(self.experts),
-            "labels_count": len(self.labels),
-            "loaded_files_count": len(self.loaded_files)
+            "groups_count": len(self.historical_data.unique('group')),
+            "experts_count": len(self.historical_data.unique('expert')),
+            "labels_count": len(self.historical_data.unique('label')),
+            "loaded_files_count": len(self.loaded_files),
+            "storage": self.historical_data.get_info()
         }
     
     def print_sample_data(self, count=5):
@@ -230,4 +585,41 @@ class DataLoader:
             print(f"   👥 Группа: {record['group']}")
             print(f"   🏷️ Метка: {record['label'] if record['label'] else 'Не указана'}")
             if record['description']:
-                print(f"   📄 Описание: {record['description'][:100]}...")
\ No newline at end of file
+                print(f"   📄 Описание: {record['description'][:100]}...")
+
+
+def list_excel_files(folder_path):
+    """xlsx файлы папки без временных файлов-блокировок Excel (~$имя.xlsx)"""
+    return [f for f in glob.glob(os.path.join(folder_path, "*.xlsx"))
+            if not os.path.basename(f).startswith("~$")]
+
+
+def _pool_context():
+    """Контекст процессов пула чтения без fork
+    
+    Загрузка идет в фоновом потоке обучения многопоточного воркера: fork в такой момент
+    может унаследовать блокировки, захваченные другими потоками, и зависнуть.
+    _load_file_in_worker нужен только импорт модуля, поэтому подходит forkserver (или spawn).
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _load_file_in_worker(file_path, cache_dir):
+    """Чтение одного файла в процессе пула: записи и состояние кэша для этого файла"""
+    loader = DataLoader(cache_dir=cache_dir, workers=1)
+    if loader.excel_cache:
+        # Индекс кэша сохраняет только родительский процесс
+        loader.excel_cache.autosave = False
+    records = loader._load_file(file_path)
+    cache_state = loader.excel_cache.get_entry_state(file_path) if loader.excel_cache else None
+    return records, cache_state
+
+
+def _excel_value(value):
+    """Значение ячейки openpyxl так, как его отдает pd.read_excel: пустые и ошибки - None, 2.0 - 2"""
+    if value is None or (isinstance(value, str) and value in ERROR_CODES):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
@@ -0,0 +1,242 @@
+"""Офлайн-оценка модели на отложенной по времени выборке
+
+Заявки сортируются по времени закрытия: модель обучается на ранних, а оценивается
+на поздних - так же, как она будет работать на новых заявках после обучения.
+Отчет: точность и top-k точность по головам, калибровка уверенности относительно
+confidence_threshold, доля заявок на модерацию и задержка предсказания.
+
+Запуск (без Flask):
+    python evaluation.py --folder Выгрузка --test-share 0.2
+    python evaluation.py --model-config '{"classifier": "sgd"}' --json eval/sgd.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_manager import ModelManager, HEADS
+from record_store import RecordStore
+
+# Границы интервалов уверенности для калибровки
+CALIBRATION_BINS = np.linspace(0, 1, 11)
+# Пороги уверенности для оценки доли модерации и точности авто-назначения
+THRESHOLD_SWEEP = (0.1, 0.2, 0.25, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+PREDICT_CHUNK = 1000  # Заявок в одном вызове predict_batch
+
+
+def time_split(store, test_share=0.2):
+    """Разделить записи по времени закрытия: (ранние для обучения, поздние для оценки, граница)
+
+    Записи без времени закрытия считаются ранними и всегда попадают в обучение.
+    """
+    records = list(store)
+    times = pd.to_datetime(pd.Series([record['close_time'] for record in records], dtype=object))
+    # NaT сортируются как самые ранние
+    order = np.argsort(times.fillna(pd.Timestamp.min).values, kind="stable")
+    test_size = int(len(records) * test_share)
+    split = len(records) - test_size
+    train = [records[i] for i in order[:split]]
+    test = [records[i] for i in order[split:]]
+    cutoff = times.iloc[order[split]] if test_size else None
+    return train, test, cutoff
+
+
+def evaluate(manager, test, top_k=3, latency_calls=300):
+    """Метрики обученной модели на записях test"""
+    items = [{"title": record['title'], "description": record['description']} for record in test]
+
+    # Без кэша предсказаний: повторяющиеся тексты не должны завышать скорость
+    max_size = manager.prediction_cache.max_size
+    manager.prediction_cache.max_size = 0
+    try:
+        start = time.perf_counter()
+        predictions = []
+        for i in range(0, len(items), PREDICT_CHUNK):
+            predictions.extend(manager.predict_batch(items[i:i + PREDICT_CHUNK], top_k=top_k))
+        batch_seconds = time.perf_counter() - start
+        latency = _single_latency(manager, items, latency_calls)
+    finally:
+        manager.prediction_cache.max_size = max_size
+
+    report = {"heads": {}}
+    for field, encoder_name, _ in HEADS:
+        known = set(getattr(manager, encoder_name).classes_)
+        report["heads"][field] = _head_report(field, test, predictions, known, manager.confidence_threshold)
+
+    all_correct = np.array([all(prediction[field] == record[field] for field, _, _ in HEADS)
+                            for prediction, record in zip(predictions, test)])
+    confidence = np.array([prediction['confidence'] for prediction in predictions])
+    moderated = np.array([prediction['needs_moderation'] for prediction in predictions])
+    report["overall"] = {
+        "all_heads_accuracy": _share(all_correct),
+        "moderation_rate": _share(moderated),
+        "spam_rate": _share([prediction['is_spam'] for prediction in predictions]),
+        # Заявки, назначенные без модерации, и доля верных среди них
+        "auto_routed": int((~moderated).sum()),
+        "auto_routed_all_heads_accuracy": _share(all_correct[~moderated]),
+        "moderated_all_heads_accuracy": _share(all_correct[moderated]),
+        "threshold_sweep": [
+            {"threshold": threshold,
+             "moderation_rate": _share(confidence < threshold),
+             "auto_routed_all_heads_accuracy": _share(all_correct[confidence >= threshold])}
+            for threshold in THRESHOLD_SWEEP
+        ],
+    }
+
+    report["latency"] = {
+        "batch_items_per_s": round(len(items) / batch_seconds, 1) if batch_seconds else None,
+        **latency,
+    }
+    return report
+
+
+def _head_report(field, test, predictions, known, threshold):
+    """Точность, top-k точность и калибровка одной головы"""
+    truth = [record[field] for record in test]
+    correct = np.array([prediction[field] == value for prediction, value in zip(predictions, truth)])
+    confidence = np.array([prediction[f'{field}_confidence'] for prediction in predictions])
+    in_top_k = np.array([
+        any(alternative['name'] == value for alternative in prediction.get('alternatives', {}).get(field, []))
+        for prediction, value in zip(predictions, truth)
+    ])
+    above = confidence >= threshold
+    return {
+        "accuracy": _share(correct),
+        "top_k_accuracy": _share(in_top_k),
+        # Классы, которых не было в обучающей выборке: модель не может их предсказать
+        "unseen_class_share": _share([value not in known for value in truth]),
+        "mean_confidence": round(float(confidence.mean()), 4) if len(confidence) else None,
+        "expected_calibration_error": _calibration_error(confidence, correct),
+        "above_threshold_share": _share(above),
+        "above_threshold_accuracy": _share(correct[above]),
+        "below_threshold_accuracy": _share(correct[~above]),
+        "calibration": _calibration_bins(confidence, correct),
+    }
+
+
+def _calibration_bins(confidence, correct):
+    """Средняя уверенность и фактическая точность по интервалам уверенности"""
+    bins = np.clip(np.digitize(confidence, CALIBRATION_BINS[1:-1]), 0, len(CALIBRATION_BINS) - 2)
+    return [
+        {"range": [round(float(CALIBRATION_BINS[b]), 2), round(float(CALIBRATION_BINS[b + 1]), 2)],
+         "count": int((bins == b).sum()),
+         "mean_confidence": round(float(confidence[bins == b].mean()), 4),
+         "accuracy": _share(correct[bins == b])}
+        for b in range(len(CALIBRATION_BINS) - 1) if (bins == b).any()
+    ]
+
+
+def _calibration_error(confidence, correct):
+    """ECE: взвешенное по числу заявок расхождение уверенности и точности"""
+    if not len(confidence):
+        return None
+    bins = np.clip(np.digitize(confidence, CALIBRATION_BINS[1:-1]), 0, len(CALIBRATION_BINS) - 2)
+    error = sum(abs(confidence[bins == b].mean() - correct[bins == b].mean()) * (bins == b).sum()
+                for b in np.unique(bins))
+    return round(float(error / len(confidence)), 4)
+
+
+def _single_latency(manager, items, calls):
+    """Задержка одиночного predict (по первым calls заявкам по кругу)"""
+    if not items or calls <= 0:
+        return {}
+    timings = []
+    for i in range(calls):
+        item = items[i % len(items)]
+        start = time.perf_counter()
+        manager.predict(item['title'], item['description'])
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "predict_p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "predict_p95_ms": round(float(np.percentile(timings, 95)), 3),
+        "predict_p99_ms": round(float(np.percentile(timings, 99)), 3),
+    }
+
+
+def _quiet(verbose):
+    """Скрыть вывод загрузки и обучения, если не нужен подробный режим"""
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def _share(values):
+    values = np.asarray(values, dtype=bool)
+    return round(float(values.mean()), 4) if len(values) else None
+
+
+def run(folder, test_share=0.2, model_config=None, top_k=3, threshold=None, verbose=False):
+    """Загрузить выгрузки, обучить модель на ранних заявках и оценить на поздних"""
+    manager = ModelManager(model_config=model_config)
+    with _quiet(verbose):
+        if threshold is not None and not manager.set_confidence_threshold(threshold):
+            raise ValueError(f"Порог уверенности должен быть от 0 до 1: {threshold}")
+        if not manager.data_loader.load_from_excel(folder):
+            raise RuntimeError(f"Не удалось загрузить данные из '{folder}'")
+
+    train, test, cutoff = time_split(manager.data_loader.historical_data, test_share)
+    if not test:
+        raise RuntimeError("Пустая отложенная выборка: увеличьте --test-share")
+
+    manager.data_loader.historical_data = RecordStore(train)
+    with _quiet(verbose):
+        start = time.perf_counter()
+        trained = manager._train_model()
+        train_seconds = time.perf_counter() - start
+    if not trained:
+        raise RuntimeError("Не удалось обучить модель на обучающей выборке")
+
+    report = {
+        "model_config": manager.model_config,
+        "confidence_threshold": manager.confidence_threshold,
+        "split": {
+            "train_records": len(train),
+            "test_records": len(test),
+            "train_without_close_time": sum(record['close_time'] is None for record in train),
+            "cutoff_close_time": cutoff.isoformat() if cutoff is not None and not pd.isna(cutoff) else None,
+        },
+        "train_s": round(train_seconds, 3),
+        **evaluate(manager, test, top_k=top_k),
+    }
+    report["top_k"] = top_k
+    return report
+
+
+def _print_summary(report):
+    split = report["split"]
+    print(f"📅 Обучение: {split['train_records']} заявок, оценка: {split['test_records']} "
+          f"(закрыты с {split['cutoff_close_time']})")
+    print(f"⏱️ Обучение {report['train_s']}s")
+    for field, head in report["heads"].items():
+        print(f"🎯 {field}: точность {head['accuracy']}, top-{report['top_k']} {head['top_k_accuracy']}, "
+              f"ECE {head['expected_calibration_error']}, новых классов {head['unseen_class_share']}")
+    overall = report["overall"]
+    print(f"🛡️ Порог {report['confidence_threshold']}: на модерацию {overall['moderation_rate']}, "
+          f"точность авто-назначения (все головы) {overall['auto_routed_all_heads_accuracy']}")
+    latency = report["latency"]
+    print(f"⚡ predict p50/p95/p99 {latency.get('predict_p50_ms')}/{latency.get('predict_p95_ms')}/"
+          f"{latency.get('predict_p99_ms')} мс, пакетно {latency['batch_items_per_s']} заявок/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-оценка модели на отложенной по времени выборке")
+    parser.add_argument("--folder", default="Выгрузка", help="Папка с xlsx выгрузками")
+    parser.add_argument("--test-share", type=float, default=0.2, help="Доля самых поздних заявок для оценки")
+    parser.add_argument("--model-config", type=json.loads, default={}, help="MODEL_CONFIG в формате JSON")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--threshold", type=float, help="confidence_threshold (по умолчанию - как в модели)")
+    parser.add_argument("--verbose", action="store_true", help="Показывать вывод загрузки и обучения")
+    parser.add_argument("--json", help="Путь для сохранения отчета в JSON")
+    args = parser.parse_args()
+
+    report = run(args.folder, args.test_share, args.model_config, args.top_k, args.threshold, args.verbose)
+    _print_summary(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
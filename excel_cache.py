@@ -0,0 +1,184 @@
+import pandas as pd
+import os
+import glob
+import json
+import hashlib
+
+CACHE_VERSION = 1  # Увеличить при изменении формата кэша
+
+
+class ExcelCache:
+    """Кэш прочитанных Excel выгрузок на диске
+
+    Каждый xlsx после pd.read_excel сохраняется как DataFrame в отдельный файл,
+    имя которого - хэш содержимого исходника. Индекс хранит для каждого пути
+    размер, mtime и хэш: если размер и mtime не изменились, файл не перечитывается
+    для хэширования, а если изменилось содержимое - старая запись кэша удаляется.
+    Записи удаленных исходников убирает prune_missing.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir="cache/excel"):
+        self.cache_dir = cache_dir
+        self.index = self._load_index()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.autosave = True  # Сохранять индекс после каждого чтения
+
+    def read_excel(self, file_path):
+        """Прочитать выгрузку из кэша или из xlsx (с записью в кэш)"""
+        key = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        entry = self.index.get(key)
+
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            content_hash = entry['hash']
+        else:
+            content_hash = self._file_hash(file_path)
+
+        if entry and entry['hash'] != content_hash:
+            # Исходный файл изменился - старая запись кэша больше не нужна
+            del self.index[key]
+            self._remove_unused(entry['hash'])
+            self.invalidations += 1
+            print(f"🔄 Файл {os.path.basename(file_path)} изменился, кэш обновлен")
+
+        cache_path = self._cache_path(content_hash)
+        df = self._read_cached(cache_path)
+        if df is not None:
+            self.hits += 1
+        else:
+            df = pd.read_excel(file_path).dropna(how='all')
+            self._write_cached(df, cache_path)
+            self.misses += 1
+
+        self.index[key] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': content_hash,
+            'rows': len(df)
+        }
+        if self.autosave:
+            self._save_index()
+        return df
+
+    def get_entry_state(self, file_path):
+        """Запись индекса и счетчики для файла (для переноса из процесса пула)"""
+        key = os.path.abspath(file_path)
+        return {
+            'key': key,
+            'entry': self.index.get(key),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+    def apply_entry_state(self, state):
+        """Применить состояние, полученное от get_entry_state в другом процессе"""
+        if state['entry']:
+            self.index[state['key']] = state['entry']
+        self.hits += state['hits']
+        self.misses += state['misses']
+        self.invalidations += state['invalidations']
+        self._save_index()
+
+    def get_info(self):
+        """Статистика кэша"""
+        return {
+            "enabled": True,
+            "cache_dir": self.cache_dir,
+            "cached_files": len(self.index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations
+        }
+
+    def prune_missing(self):
+        """Удалить записи и файлы кэша исходников, которых больше нет на диске
+
+        Возвращает число удаленных записей.
+        """
+        missing = [key for key in self.index if not os.path.exists(key)]
+        if not missing:
+            return 0
+        removed = [self.index.pop(key) for key in missing]
+        for entry in removed:
+            self._remove_unused(entry['hash'])
+        self._save_index()
+        print(f"🧹 Удалено {len(missing)} записей кэша для удаленных выгрузок")
+        return len(missing)
+
+    def clear(self):
+        """Удалить все файлы кэша"""
+        for file in glob.glob(os.path.join(self.cache_dir, "*")):
+            try:
+                os.remove(file)
+            except OSError as e:
+                print(f"⚠️ Не удалось удалить файл кэша {file}: {e}")
+        self.index = {}
+
+    def _cache_path(self, content_hash):
+        return os.path.join(self.cache_dir, f"v{CACHE_VERSION}_{content_hash}.pkl")
+
+    def _read_cached(self, cache_path):
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            print(f"⚠️ Поврежденный файл кэша {os.path.basename(cache_path)}: {e}")
+            return None
+
+    def _write_cached(self, df, cache_path):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            df.to_pickle(tmp_path, compression=None)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"⚠️ Не удалось записать кэш {os.path.basename(cache_path)}: {e}")
+
+    def _remove_unused(self, content_hash):
+        """Удалить файл кэша, если на этот хэш не ссылается ни один исходник"""
+        if any(entry['hash'] == content_hash for entry in self.index.values()):
+            return
+        try:
+            os.remove(self._cache_path(content_hash))
+        except OSError:
+            pass
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX_FILE), encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get('version') != CACHE_VERSION:
+                return {}
+            return index.get('files', {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'version': CACHE_VERSION, 'files': self.index}, f, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить индекс кэша: {e}")
+
+    @staticmethod
+    def _file_hash(file_path):
+        return file_hash(file_path)
+
+
+def file_hash(file_path):
+    """SHA-1 содержимого файла (читается блоками по 1 МБ)"""
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
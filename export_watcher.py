@@ -0,0 +1,230 @@
+"""Автоматическая загрузка новых выгрузок из папки с отложенным переобучением
+
+Запуск отдельным процессом (без Flask):
+    python export_watcher.py --folder Выгрузка --interval 10 --settle 30 --cooldown 600
+
+В веб-сервере включается переменной EXPORT_WATCH=1 (см. app.py).
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import zipfile
+
+try:
+    import fcntl
+except ImportError:  # Windows: наблюдатель в каждом процессе
+    fcntl = None
+
+from data_loader import list_excel_files
+from metrics import registry
+from model_manager import ModelManager
+from training_jobs import TrainingJobManager
+
+
+class ExportWatcher:
+    """Наблюдение за папкой выгрузок и переобучение при появлении новых xlsx
+
+    Папка опрашивается раз в poll_interval секунд (stat файлов, без чтения). Любой новый
+    или изменившийся файл откладывает переобучение: оно запускается, только когда
+    в папке settle_seconds ничего не менялось - файлы дописаны, а пачка файлов,
+    копируемых один за другим, дает одно переобучение. Между переобучениями проходит
+    не меньше cooldown_seconds. Какие файлы новые, решает DataLoader (по манифесту
+    загрузки), поэтому touch без изменения содержимого переобучения не вызывает.
+
+    retrain(files) запускает переобучение и возвращает False, если оно не запущено
+    (например, уже идет обучение) - тогда попытка повторится при следующем опросе.
+    sync() вызывается перед сравнением с манифестом: подхватывает модель, сохраненную
+    другим процессом, чтобы уже обученные им файлы не считались новыми.
+    С state_dir опрашивает папку только один процесс (файловая блокировка), остальные
+    воркеры ждут и подхватывают наблюдение, если этот процесс завершится.
+    """
+
+    LOCK_FILE = "export_watcher.lock"
+
+    def __init__(self, folder_path, data_loader, retrain, is_busy=None, sync=None,
+                 poll_interval=10, settle_seconds=30, cooldown_seconds=600, state_dir=None):
+        self.folder_path = folder_path
+        self.data_loader = data_loader
+        self.retrain = retrain
+        self.is_busy = is_busy
+        self.sync = sync
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.state_dir = state_dir
+        self.retrains = 0
+        self._snapshot = {}
+        self._last_change = None
+        # При старте проверить файлы, появившиеся, пока наблюдатель не работал
+        self._dirty = True
+        self._last_retrain = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock_file = None
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def start(self):
+        """Запустить наблюдение в фоновом потоке (после fork - заново в новом процессе)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._lock_file = None
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="export-watcher", daemon=True)
+        self._thread.start()
+        print(f"👀 Наблюдение за папкой '{self.folder_path}': опрос раз в {self.poll_interval:g} с, "
+              f"тишина {self.settle_seconds:g} с, пауза между переобучениями {self.cooldown_seconds:g} с")
+
+    def stop(self):
+        """Остановить фоновое наблюдение"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._release_process_lock()
+
+    def run_forever(self):
+        """Наблюдение в текущем потоке до Ctrl+C"""
+        self._pid = os.getpid()
+        try:
+            self._run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._release_process_lock()
+
+    def poll(self, now=None):
+        """Один опрос папки. Возвращает True, если запущено переобучение"""
+        now = time.monotonic() if now is None else now
+        snapshot = self._scan()
+        if snapshot != self._snapshot:
+            self._snapshot = snapshot
+            self._last_change = now
+            self._dirty = True
+
+        if not self._dirty:
+            return False
+        # Файлы еще копируются: ждем, пока папка успокоится
+        if self._last_change is not None and now - self._last_change < self.settle_seconds:
+            return False
+        if self._last_retrain is not None and now - self._last_retrain < self.cooldown_seconds:
+            return False
+        if self.is_busy and self.is_busy():
+            return False
+        if self.sync:
+            self.sync()
+
+        pending = self.data_loader.pending_files(list(snapshot))
+        # Недописанный xlsx - не zip-архив; когда он допишется, изменится и его stat
+        incomplete = [f for f in pending if not zipfile.is_zipfile(f)]
+        ready = [f for f in pending if f not in incomplete]
+        if incomplete:
+            print(f"⚠️ Пропущены недописанные или поврежденные файлы: "
+                  f"{[os.path.basename(f) for f in incomplete]}")
+        if not ready:
+            self._dirty = False
+            return False
+
+        print(f"👀 Новых или измененных выгрузок: {len(ready)}, запуск переобучения")
+        if not self.retrain(ready):
+            return False
+        self._dirty = False
+        self._last_retrain = now
+        self.retrains += 1
+        registry.inc("export_watcher_retrains_total")
+        return True
+
+    def get_info(self):
+        return {
+            "enabled": True,
+            "folder": self.folder_path,
+            "poll_interval": self.poll_interval,
+            "settle_seconds": self.settle_seconds,
+            "cooldown_seconds": self.cooldown_seconds,
+            "files": len(self._snapshot),
+            "retrains": self.retrains,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._acquire_process_lock():
+                    self.poll()
+            except Exception as e:
+                registry.inc("errors_total", operation="export_watch")
+                print(f"❌ Ошибка наблюдения за папкой '{self.folder_path}': {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _scan(self):
+        """Размер и mtime каждого xlsx папки"""
+        snapshot = {}
+        for file_path in list_excel_files(self.folder_path):
+            try:
+                stat = os.stat(file_path)
+            except OSError:  # Файл удален между glob и stat
+                continue
+            snapshot[file_path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def _acquire_process_lock(self):
+        """Блокировка наблюдателя без ожидания; уже захваченная - сохраняется"""
+        if not self.state_dir or fcntl is None or self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(self.state_dir, self.LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_process_lock(self):
+        if self._lock_file:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Автоматическая загрузка новых выгрузок и переобучение")
+    parser.add_argument("--folder", default="Выгрузка", help="Папка с xlsx выгрузками")
+    parser.add_argument("--model", default="model", help="Папка сохраненной модели")
+    parser.add_argument("--interval", type=float, default=float(os.environ.get('EXPORT_WATCH_INTERVAL', 10)),
+                        help="Интервал опроса папки, с")
+    parser.add_argument("--settle", type=float, default=float(os.environ.get('EXPORT_WATCH_SETTLE', 30)),
+                        help="Сколько секунд в папке ничего не должно меняться перед переобучением")
+    parser.add_argument("--cooldown", type=float, default=float(os.environ.get('EXPORT_RETRAIN_COOLDOWN', 600)),
+                        help="Минимальный интервал между переобучениями, с")
+    args = parser.parse_args()
+
+    model_manager = ModelManager(model_config=json.loads(os.environ.get('MODEL_CONFIG', '{}')))
+    if os.path.exists(args.model):
+        model_manager.load_model(args.model)
+    # Те же файлы состояния, что у веб-сервера: обучение не идет одновременно с /load_excel
+    state_dir = os.environ.get('TRAINING_STATE_DIR', 'cache/jobs')
+    training_jobs = TrainingJobManager(state_dir=state_dir)
+
+    def load_and_train():
+        if not model_manager.load_and_train(args.folder):
+            return {"status": "error", "message": "Не удалось загрузить данные из Excel файлов"}
+        model_manager.save_model(args.model)
+        return {"status": "success", "records_loaded": len(model_manager.data_loader.historical_data)}
+
+    watcher = ExportWatcher(
+        args.folder, model_manager.data_loader,
+        retrain=lambda files: training_jobs.submit("watch_excel", load_and_train)[1],
+        is_busy=training_jobs.is_running,
+        sync=lambda: model_manager.reload_if_changed(args.model, force=True),
+        poll_interval=args.interval, settle_seconds=args.settle, cooldown_seconds=args.cooldown,
+        state_dir=state_dir
+    )
+    print(f"👀 Наблюдение за папкой '{args.folder}' (Ctrl+C - выход)")
+    watcher.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Настройки gunicorn для продакшн-запуска (см. wsgi.py)"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Число воркеров: WEB_CONCURRENCY, по умолчанию 2. Не по числу ядер: в контейнере это обычно
+# ядра хоста, а каждый воркер держит свою копию модели - после первого переобучения
+# воркеры загружают ее с диска (reload_if_changed), и sklearn копирует узлы деревьев
+# RandomForest в память процесса. Общие страницы copy-on-write есть только у модели,
+# загруженной до fork (preload_app). Память под модели - примерно workers x размер модели
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Потоки внутри воркера: обучение идет в фоновом потоке, запросы обслуживаются параллельно
+worker_class = "gthread"
+# Запрос /predict занимает поток, пока ждет свою пачку: в пачке воркера не больше заявок,
+# чем потоков. Поэтому с MICRO_BATCHING=1 потоков по умолчанию столько же, сколько заявок
+# в пачке (MICRO_BATCH_MAX_SIZE), а пачка ограничивается числом потоков (см. post_fork)
+if os.environ.get('MICRO_BATCHING') == '1':
+    threads = int(os.environ.get('GUNICORN_THREADS', os.environ.get('MICRO_BATCH_MAX_SIZE', 32)))
+else:
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Модель загружается до fork и разделяется воркерами (до первого переобучения, см. выше)
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    """Наблюдатель за папкой выгрузок (EXPORT_WATCH=1) - поток воркера, а не мастера"""
+    from app import export_watcher, micro_batcher
+    if export_watcher:
+        export_watcher.start()
+    if micro_batcher and micro_batcher.max_batch_size > worker.cfg.threads:
+        # Больше заявок, чем потоков, не набрать: пачка уходит сразу, без ожидания max_wait
+        micro_batcher.max_batch_size = worker.cfg.threads
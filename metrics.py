@@ -0,0 +1,194 @@
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы гистограмм, секунды: от одной заявки (доли миллисекунды) до полного обучения
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами в формате Prometheus (накопительные бакеты)"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последний бакет - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Метрики процесса: гистограммы длительности этапов и счетчики ошибок
+
+    Значения хранятся в памяти процесса: при нескольких воркерах gunicorn /metrics
+    отдает метрики того воркера, который обработал запрос.
+    """
+
+    def __init__(self, prefix="smax"):
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        """Добавить наблюдение в гистограмму name с метками labels"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        """Увеличить счетчик name с метками labels"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, operation, stage="total"):
+        """Замер длительности этапа stage операции operation"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_duration_seconds", time.perf_counter() - start,
+                         operation=operation, stage=stage)
+
+    def get_summary(self):
+        """Число замеров и средняя длительность по этапам (для /stats и отладки)"""
+        with self._lock:
+            return {
+                f"{dict(labels).get('operation')}.{dict(labels).get('stage')}": {
+                    "count": histogram.count,
+                    "avg_ms": round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0.0
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+                if name == "stage_duration_seconds"
+            }
+
+    def render(self, gauges=None):
+        """Метрики в текстовом формате Prometheus
+
+        gauges - словарь {имя: значение} текущих значений, которые считаются при запросе.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._histograms}):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for (hist_name, labels), histogram in sorted(self._histograms.items()):
+                    if hist_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{metric}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+
+            for name in sorted({name for name, _ in self._counters}):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for (counter_name, labels), value in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        for name, value in sorted((gauges or {}).items()):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Profiler:
+    """Выборочное профилирование cProfile, включаемое на работающем сервисе
+
+    Профилируется доля sample_rate вызовов и не больше одного вызова одновременно,
+    остальные выполняются без профилировщика. Выключенный профилировщик стоит одну
+    проверку флага. Статистика накапливается по именам участков до reset().
+    """
+
+    def __init__(self, sample_rate=0.0):
+        self.sample_rate = sample_rate
+        self.profiled_calls = {}
+        self._stats = {}
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    @contextmanager
+    def profile(self, name):
+        """Профилировать участок кода, если вызов попал в выборку"""
+        if not self.enabled or random.random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+            with self._lock:
+                if name in self._stats:
+                    self._stats[name].add(profile)
+                else:
+                    self._stats[name] = pstats.Stats(profile)
+                self.profiled_calls[name] = self.profiled_calls.get(name, 0) + 1
+        finally:
+            self._busy.release()
+
+    def configure(self, sample_rate=None, reset=False):
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(float(sample_rate), 1.0))
+        if reset:
+            self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self.profiled_calls = {}
+
+    def get_report(self, limit=25, sort="cumulative"):
+        """Самые затратные функции по каждому участку в текстовом виде pstats"""
+        report = {}
+        with self._lock:
+            for name, stats in self._stats.items():
+                output = io.StringIO()
+                stats.stream = output
+                stats.sort_stats(sort).print_stats(limit)
+                report[name] = {"calls": self.profiled_calls[name], "stats": output.getvalue()}
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "profiles": report}
+
+
+# Общие для процесса метрики и профилировщик
+registry = MetricsRegistry()
+# PROFILING_SAMPLE_RATE - доля профилируемых запросов (0 - выключено, 0.01 - каждый сотый)
+profiler = Profiler(sample_rate=float(os.environ.get('PROFILING_SAMPLE_RATE', 0)))
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import threading
+import time
+
+
+class MicroBatcher:
+    """Микро-батчинг запросов /predict
+
+    Запросы складываются в asyncio-очередь, а отдельная корутина отправляет их
+    в ModelManager.predict_batch пачкой: как только набралось max_batch_size
+    заявок или прошло max_wait_ms с момента первой заявки в пачке. Фиксированные
+    накладные расходы sklearn и векторизации делятся на всю пачку.
+
+    Цикл событий работает в фоновом потоке и запускается при первом запросе
+    (и заново после fork воркера gunicorn). Потоки Flask вызывают синхронный
+    predict, корутины - predict_async. Синхронный вызов занимает поток до ответа, поэтому
+    пачка не больше числа потоков-клиентов: под gunicorn gthread max_batch_size
+    ограничивается числом потоков воркера (см. gunicorn.conf.py).
+    """
+
+    def __init__(self, model_manager, max_batch_size=32, max_wait_ms=5, timeout=30):
+        self.model_manager = model_manager
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+        self.batches = 0
+        self.items = 0
+        self._loop = None
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def predict(self, title, description, top_k=0):
+        """Предсказание через общую пачку (вызов из обычного потока)"""
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self.predict_async(title, description, top_k), loop)
+        return future.result(self.timeout)
+
+    async def predict_async(self, title, description, top_k=0):
+        """Предсказание через общую пачку (вызов из корутины в цикле батчера)"""
+        future = self._loop.create_future()
+        await self._queue.put(({"title": title, "description": description}, top_k, future))
+        return await future
+
+    def get_info(self):
+        """Статистика батчинга"""
+        return {
+            "enabled": True,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0
+        }
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is None or self._pid != os.getpid():
+                ready = threading.Event()
+                thread = threading.Thread(target=self._run_loop, args=(ready,), name="micro-batcher", daemon=True)
+                thread.start()
+                ready.wait()
+                self._pid = os.getpid()
+            return self._loop
+
+    def _run_loop(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._loop.create_task(self._collect_batches())
+        ready.set()
+        self._loop.run_forever()
+
+    async def _collect_batches(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Модель работает в пуле потоков, чтобы очередь продолжала принимать заявки
+            await self._loop.run_in_executor(None, self._predict_batch, batch)
+
+    def _predict_batch(self, batch):
+        # top_k влияет на формат ответа, поэтому пачка делится по нему
+        by_top_k = {}
+        for entry in batch:
+            by_top_k.setdefault(entry[1], []).append(entry)
+
+        for top_k, entries in by_top_k.items():
+            try:
+                results = self.model_manager.predict_batch([item for item, _, _ in entries], top_k=top_k)
+                outcomes = [(future, result, None) for (_, _, future), result in zip(entries, results)]
+            except Exception as e:
+                outcomes = [(future, None, e) for _, _, future in entries]
+            for future, result, error in outcomes:
+                self._loop.call_soon_threadsafe(self._resolve, future, result, error)
+
+        self.batches += 1
+        self.items += len(batch)
+
+    @staticmethod
+    def _resolve(future, result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
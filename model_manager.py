@@ -1,17 +1,171 @@
-import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier, LogisticRegression
+from sklearn.svm import LinearSVC
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.model_selection import StratifiedKFold
+from scipy.special import expit, softmax
+import sklearn
 import joblib
+import json
 import os
 import glob
+import copy
+import threading
+import time
+import warnings
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from data_loader import DataLoader
 from spam_protector import SpamProtector
+from prediction_cache import PredictionCache
+from metrics import registry
+from similarity_index import SimilarTicketsIndex
+from record_store import RecordStore
+import text_features
+
+# Компоненты модели, которые подменяются и сохраняются вместе
+MODEL_COMPONENTS = [
+    "vectorizer",
+    "group_encoder",
+    "expert_encoder",
+    "label_encoder",
+    "group_classifier",
+    "expert_classifier",
+    "label_classifier",
+    "shared_classifier",
+    "similarity_index"
+]
+# Компоненты, которых нет в моделях, сохраненных ранними версиями
+OPTIONAL_COMPONENTS = {"shared_classifier", "similarity_index"}
+
+# Формат сохраненной модели: один бандл с компонентами и манифест
+MODEL_FORMAT_VERSION = 2
+MODEL_BUNDLE_FILE = "model_bundle.joblib"
+MODEL_MANIFEST_FILE = "manifest.json"
+
+# Три головы модели: поле записи, кодировщик и классификатор
+HEADS = [
+    ("group", "group_encoder", "group_classifier"),
+    ("expert", "expert_encoder", "expert_classifier"),
+    ("label", "label_encoder", "label_classifier")
+]
+
+class CalibrationFolds:
+    """Стратифицированные фолды для калибровки LinearSVC
+    
+    В выгрузках есть эксперты с одной-двумя заявками, а CalibratedClassifierCV с cv=3
+    отказывается работать с такими классами. Без атрибута n_splits эта проверка не
+    выполняется, а классы, отсутствующие в обучающем фолде, калибратор учитывает сам.
+    """
+    
+    def split(self, X, y, groups=None):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            yield from StratifiedKFold(n_splits=3, shuffle=True, random_state=42).split(X, y)
+    
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return 3
+
+
+# Доступные классификаторы для голов модели (фабрики получают настройки модели)
+CLASSIFIER_BACKENDS = {
+    "random_forest": lambda config: RandomForestClassifier(
+        n_estimators=config["n_estimators"], max_depth=config["max_depth"],
+        min_samples_leaf=config["min_samples_leaf"], max_samples=config["max_samples"],
+        n_jobs=config["n_jobs"], random_state=42),
+    "sgd": lambda config: SGDClassifier(loss="log_loss", alpha=1e-5, max_iter=50, tol=1e-3, random_state=42),
+    "logistic_regression": lambda config: LogisticRegression(C=10.0, max_iter=1000),
+    # LinearSVC не дает вероятностей - калибруем его для уверенности и порога модерации
+    "linear_svc": lambda config: CalibratedClassifierCV(LinearSVC(C=1.0), method="sigmoid", cv=CalibrationFolds(),
+                                                          ensemble=False)
+}
+
+# Настройки модели по умолчанию (сохраняются вместе с моделью)
+DEFAULT_MODEL_CONFIG = {
+    # Классификатор из CLASSIFIER_BACKENDS; None - random_forest, в инкрементальном режиме sgd
+    "classifier": None,
+    # Инкрементальный режим: HashingVectorizer без обучения словаря + SGDClassifier,
+    # при загрузке новых файлов модель дообучается только на них (partial_fit)
+    "incremental": False,
+    "hashing_n_features": 2 ** 16,
+    "incremental_epochs": 5,
+    # Один multi-output RandomForest вместо трех отдельных (только для random_forest)
+    "multi_output": False,
+    # Индекс похожих исторических заявок (строится при обучении, хранится вместе с моделью)
+    "similar_tickets": True,
+    # Признаки текста (см. text_features): "word" - слова, "char_wb" - символьные n-граммы
+    # внутри слов (например, с "ngram_range": [2, 4]); max_features - размер словаря TF-IDF
+    "text_analyzer": "word",
+    "ngram_range": [1, 1],
+    "max_features": 1500,
+    # Нормализация русского текста (регистр, ё -> е) и обрезка слов до stem_length символов (0 - нет)
+    "normalize_text": False,
+    "stem_length": 0,
+    # HashingVectorizer вместо TF-IDF и в неинкрементальном режиме: без прохода обучения словаря
+    # (признаков - max_features, hashing_n_features только для инкрементального режима)
+    "text_hashing": False,
+    # Тип значений матрицы признаков: float32 вдвое меньше по памяти
+    "text_dtype": "float32",
+    # Параметры леса (random_forest). None - без ограничения: деревья растут до чистых листьев,
+    # поэтому на больших выгрузках модель долго обучается и много весит
+    "n_estimators": 100,
+    "max_depth": None,
+    "min_samples_leaf": 1,
+    # Доля (0..1] или число заявок в бутстрэп-выборке каждого дерева
+    "max_samples": None,
+    # Потоков для обучения одного леса (-1 - все ядра). Предсказание всегда в одном потоке:
+    # для одной заявки пул потоков только добавляет задержку
+    "n_jobs": None,
+    # Обучать головы одновременно в потоках (sklearn строит деревья без GIL)
+    "parallel_heads": False
+}
+
+
+def predict_proba(classifier, X):
+    """predict_proba с быстрым путем для линейных моделей
+    
+    Для одной заявки большая часть времени sklearn уходит на проверки входных данных,
+    поэтому для SGDClassifier и LogisticRegression вероятности считаются напрямую
+    по coef_/intercept_ теми же формулами, что и в sklearn.
+    """
+    if not isinstance(classifier, (SGDClassifier, LogisticRegression)) or not hasattr(classifier, "coef_"):
+        return classifier.predict_proba(X)
+    
+    scores = np.asarray(X @ classifier.coef_.T) + classifier.intercept_
+    if scores.shape[1] == 1:
+        # Бинарная классификация
+        positive = expit(scores[:, 0])
+        return np.column_stack([1 - positive, positive])
+    if isinstance(classifier, LogisticRegression):
+        return softmax(scores, axis=1)
+    
+    # SGDClassifier(log_loss): one-vs-rest с нормировкой, как в sklearn
+    proba = expit(scores)
+    proba_sum = proba.sum(axis=1)
+    all_zero = proba_sum == 0
+    if np.any(all_zero):
+        proba[all_zero, :] = 1
+        proba_sum[all_zero] = proba.shape[1]
+    return proba / proba_sum[:, np.newaxis]
+
 
 class ModelManager:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(max_features=1500, stop_words=['и', 'в', 'на', 'с', 'по', 'для', 'за', 'к'])
+    def __init__(self, model_config=None):
+        # Настройки для новых обучений (из конструктора / MODEL_CONFIG) - загрузка модели их не меняет
+        self.model_config = self._resolve_model_config(model_config)
+        # Настройки, с которыми обучены текущие модели (None - модель не обучена)
+        self.trained_model_config = None
+        
+        # Защищает согласованную замену набора моделей (векторизатор, кодировщики, классификаторы)
+        self._model_lock = threading.Lock()
+        # Не дает двум загрузкам/обучениям идти одновременно
+        self._training_lock = threading.Lock()
+        
+        self.vectorizer = self._create_vectorizer()
         self.group_encoder = LabelEncoder()
         self.expert_encoder = LabelEncoder()
         self.label_encoder = LabelEncoder()
@@ -19,142 +173,474 @@ class ModelManager:
         self.group_classifier = None
         self.expert_classifier = None
         self.label_classifier = None
+        self.shared_classifier = None  # multi-output модель для всех трех голов
+        self.similarity_index = None  # Поиск похожих исторических заявок
         
         self.data_loader = DataLoader()
         self.spam_protector = SpamProtector()
         self.is_trained = False
+        # Версия модели увеличивается при каждой подмене и входит в ключ кэша предсказаний
+        self.model_version = 0
+        # ID сохраненной модели на диске: по нему воркеры замечают модель, обученную другим процессом
+        self.model_id = None
+        self._manifest_mtime_ns = None
+        self._last_sync_check = 0.0
+        self.sync_interval = float(os.environ.get('MODEL_SYNC_INTERVAL', 5))
+        self.prediction_cache = PredictionCache(
+            max_size=int(os.environ.get('PREDICTION_CACHE_SIZE', 10000)),
+            ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+        )
         self.confidence_threshold = 0.25  # Порог уверенности 25%
+        self.last_training_info = None
         
-    def load_and_train(self, folder_path="Выгрузка"):
-        """Загрузка данных и обучение модели"""
-        success = self.data_loader.load_from_excel(folder_path)
-        if not success:
-            return False
-        return self._train_model()
+    def load_and_train(self, folder_path="Выгрузка", force_reload=False):
+        """Загрузка данных и обучение модели
+        
+        force_reload=True - перечитать все файлы папки, а не только новые.
+        """
+        with self._training_lock:
+            if force_reload:
+                self.data_loader.force_reload_all(folder_path)
+            success = self.data_loader.load_from_excel(folder_path)
+            if not success:
+                return False
+            
+            load_info = self.data_loader.last_load_info
+            # Без новых записей переобучать незачем, если модель обучена с текущими настройками
+            if (not force_reload and not load_info["added"] and not load_info["removed"] and self.is_trained
+                    and self.trained_model_config == self.model_config):
+                print("ℹ️ Новых записей нет, модель не изменилась")
+                return True
+            
+            # Дообучение возможно, только если прежние записи не удалялись (не было измененных файлов)
+            # и текущая модель обучена с теми же настройками
+            if (self.model_config["incremental"] and not force_reload and not load_info["removed"]
+                    and self.trained_model_config == self.model_config and self._supports_incremental()):
+                result = self._train_incremental(self.data_loader.historical_data.newest(load_info["added"]))
+                if result is not None:
+                    return result
+            
+            return self._train_model()
     
     def _train_model(self):
-        """Обучение модели на загруженных данных"""
-        if len(self.data_loader.historical_data) < 10:
+        """Обучение модели на загруженных данных
+        
+        Новые векторизатор, кодировщики и классификаторы строятся отдельно от текущих
+        и подменяются одной операцией, поэтому predict во время обучения продолжает
+        работать со старой согласованной моделью.
+        """
+        historical_data = self.data_loader.historical_data
+        if len(historical_data) < 10:
             print("⚠️ Недостаточно данных для обучения")
             return False
             
         try:
-            df = pd.DataFrame(self.data_loader.historical_data)
+            start_time = time.perf_counter()
             
-            # Векторизуем объединенный текст
-            X = self.vectorizer.fit_transform(df['full_text'])
+            # Векторизуем объединенный текст (тексты собираются из хранилища по одному)
+            vectorizer = self._create_vectorizer()
+            with registry.timer("train", "vectorize"):
+                X = text_features.fit_transform(vectorizer, historical_data)
             
-            # Обучаем кодировщики и классификаторы для групп
-            groups_encoded = self.group_encoder.fit_transform(df['group'])
-            self.group_classifier = RandomForestClassifier(n_estimators=100, random_state=42)
-            self.group_classifier.fit(X, groups_encoded)
+            # Кодировщики для групп, экспертов и меток - прямо по кодам хранилища
+            models = {"vectorizer": vectorizer}
+            targets = []
+            with registry.timer("train", "encode"):
+                for field, encoder_name, _ in HEADS:
+                    encoder = LabelEncoder()
+                    encoder.classes_, y = historical_data.encode(field)
+                    targets.append(y)
+                    models[encoder_name] = encoder
             
-            # Обучаем кодировщики и классификаторы для экспертов
-            experts_encoded = self.expert_encoder.fit_transform(df['expert'])
-            self.expert_classifier = RandomForestClassifier(n_estimators=100, random_state=42)
-            self.expert_classifier.fit(X, experts_encoded)
+            if self._uses_shared_model():
+                # Один multi-output лес на все три головы
+                models["shared_classifier"] = self._fit_head(X, "shared_classifier", np.column_stack(targets))
+                for _, _, classifier_name in HEADS:
+                    models[classifier_name] = None
+            else:
+                # Отдельный классификатор на каждую голову
+                heads = [(classifier_name, y) for (_, _, classifier_name), y in zip(HEADS, targets)]
+                if self.model_config["parallel_heads"]:
+                    with ThreadPoolExecutor(max_workers=len(heads)) as pool:
+                        classifiers = list(pool.map(lambda head: self._fit_head(X, *head), heads))
+                else:
+                    classifiers = [self._fit_head(X, *head) for head in heads]
+                for (classifier_name, _), classifier in zip(heads, classifiers):
+                    models[classifier_name] = classifier
+                models["shared_classifier"] = None
             
-            # Обучаем кодировщики и классификаторы для меток
-            labels_encoded = self.label_encoder.fit_transform(df['label'])
-            self.label_classifier = RandomForestClassifier(n_estimators=100, random_state=42)
-            self.label_classifier.fit(X, labels_encoded)
+            models["similarity_index"] = None
+            if self.model_config["similar_tickets"]:
+                with registry.timer("train", "similarity_index"):
+                    models["similarity_index"] = SimilarTicketsIndex.build(X, historical_data)
             
-            self.is_trained = True
-            print(f"✅ Модель обучена на {len(df)} заявках")
+            self._swap_models(models, is_trained=True)
+            self.trained_model_config = self.model_config
+            seconds = time.perf_counter() - start_time
+            registry.observe("stage_duration_seconds", seconds, operation="train", stage="total")
+            self.last_training_info = {
+                "mode": "full",
+                "records": len(historical_data),
+                "seconds": round(seconds, 3)
+            }
+            print(f"✅ Модель обучена на {len(historical_data)} заявках")
             return True
             
         except Exception as e:
+            registry.inc("errors_total", operation="train")
             print(f"❌ Ошибка обучения модели: {e}")
             return False
     
-    def predict(self, title, description):
-        """Предсказание группы, эксперта и метки с проверкой на спам и уверенность"""
-        
-        # 1. Проверка на спам перед предсказанием
-        is_spam, spam_message = self.spam_protector.is_spam(title, description)
-        if is_spam:
-            return {
-                "group": "СПАМ-ФИЛЬТР",
-                "expert": "Система защиты",
-                "label": "Заблокировано",
-                "confidence": 0.0,
-                "group_confidence": 0.0,
-                "expert_confidence": 0.0,
-                "label_confidence": 0.0,
-                "is_spam": True,
-                "spam_message": spam_message,
-                "message": "Запрос заблокирован спам-фильтром",
-                "needs_moderation": True,
-                "moderation_reason": "Обнаружен спам"
-            }
+    def _train_incremental(self, new_records):
+        """Дообучение текущей модели только на новых записях
         
-        # 2. Проверка, обучена ли модель
-        if not self.is_trained:
-            return self._fallback_prediction(title, description)
-            
+        Возвращает None, если дообучение невозможно (в новых данных есть
+        неизвестные модели группы, эксперты или метки) и нужно полное обучение.
+        """
         try:
-            full_text = f"{title}. {description}" if description else title
-            X = self.vectorizer.transform([full_text])
+            start_time = time.perf_counter()
+            models = self._model_snapshot()
+            if not isinstance(new_records, RecordStore):
+                new_records = RecordStore(new_records)
             
-            # Предсказываем группу
-            group_encoded = self.group_classifier.predict(X)[0]
-            group = self.group_encoder.inverse_transform([group_encoded])[0]
-            group_confidence = np.max(self.group_classifier.predict_proba(X))
+            for field, encoder_name, _ in HEADS:
+                unknown = new_records.unique(field) - set(models[encoder_name].classes_)
+                if unknown:
+                    print(f"ℹ️ В новых данных {len(unknown)} новых значений '{field}' - нужно полное обучение")
+                    return None
             
-            # Предсказываем эксперта
-            expert_encoded = self.expert_classifier.predict(X)[0]
-            expert = self.expert_encoder.inverse_transform([expert_encoded])[0]
-            expert_confidence = np.max(self.expert_classifier.predict_proba(X))
+            # HashingVectorizer не обучается, словарь не пересчитывается
+            X = models["vectorizer"].transform(new_records.iter_full_text())
             
-            # Предсказываем метку
-            label_encoded = self.label_classifier.predict(X)[0]
-            label = self.label_encoder.inverse_transform([label_encoded])[0]
-            label_confidence = np.max(self.label_classifier.predict_proba(X))
+            # Дообучаем копии, чтобы predict до подмены видел прежнюю модель
+            updated = {}
+            accuracy_before = {}
+            for field, encoder_name, classifier_name in HEADS:
+                y = models[encoder_name].transform(new_records.column(field))
+                classifier = copy.deepcopy(models[classifier_name])
+                # Точность на новых данных до дообучения - оценка того, насколько модель отстала
+                accuracy_before[field] = round(float(np.mean(classifier.predict(X) == y)), 3)
+                for _ in range(self.model_config["incremental_epochs"]):
+                    classifier.partial_fit(X, y)
+                updated[classifier_name] = classifier
             
-            confidence = min(group_confidence, expert_confidence, label_confidence)
+            if models["similarity_index"] is not None:
+                updated["similarity_index"] = models["similarity_index"].add(X, new_records)
             
-            # 3. Проверка уверенности модели
-            needs_moderation = False
-            moderation_reason = ""
+            self._swap_models(updated, is_trained=True)
+            seconds = time.perf_counter() - start_time
+            registry.observe("stage_duration_seconds", seconds, operation="train_incremental", stage="total")
+            self.last_training_info = {
+                "mode": "incremental",
+                "records": len(new_records),
+                "seconds": round(seconds, 3),
+                "new_data_accuracy_before_update": accuracy_before
+            }
+            print(f"✅ Модель дообучена на {len(new_records)} новых заявках")
+            return True
             
-            if confidence < self.confidence_threshold:
-                needs_moderation = True
-                if confidence < 0.1:
-                    moderation_reason = "Низкая уверенность модели: возможная опечатка или бессмысленный запрос"
-                else:
-                    moderation_reason = f"Низкая уверенность модели ({confidence:.1%}) - требуется проверка человеком"
+        except Exception as e:
+            registry.inc("errors_total", operation="train_incremental")
+            print(f"❌ Ошибка дообучения модели: {e}")
+            return False
+    
+    def _fit_head(self, X, classifier_name, y):
+        """Обучить классификатор одной головы (или общий) и переключить его на предсказание в одном потоке"""
+        classifier = self._create_classifier()
+        with registry.timer("train", classifier_name):
+            classifier.fit(X, y)
+        if getattr(classifier, "n_jobs", None) not in (None, 1):
+            classifier.set_params(n_jobs=None)
+        return classifier
+    
+    def _supports_incremental(self):
+        """Текущая модель обучена и может дообучаться без пересчета словаря"""
+        return (self.is_trained
+                and isinstance(self.vectorizer, HashingVectorizer)
+                and all(hasattr(getattr(self, name), "partial_fit") for _, _, name in HEADS))
+    
+    def _uses_shared_model(self):
+        """Обучать одну multi-output модель на все головы"""
+        return self.model_config["multi_output"] and self.model_config["classifier"] == "random_forest"
+    
+    @staticmethod
+    def _resolve_model_config(model_config):
+        """Настройки модели поверх значений по умолчанию с проверкой классификатора"""
+        config = {**DEFAULT_MODEL_CONFIG, **(model_config or {})}
+        if config["classifier"] is None:
+            config["classifier"] = "sgd" if config["incremental"] else "random_forest"
+        
+        if config["classifier"] not in CLASSIFIER_BACKENDS:
+            raise ValueError(f"Неизвестный классификатор '{config['classifier']}', "
+                             f"доступны: {', '.join(CLASSIFIER_BACKENDS)}")
+        if config["text_analyzer"] not in ("word", "char", "char_wb"):
+            raise ValueError(f"Неизвестный анализатор текста '{config['text_analyzer']}', доступны: word, char, char_wb")
+        if config["text_dtype"] not in text_features.DTYPES:
+            raise ValueError(f"Неизвестный тип признаков '{config['text_dtype']}', "
+                             f"доступны: {', '.join(text_features.DTYPES)}")
+        if config["incremental"] and not hasattr(CLASSIFIER_BACKENDS[config["classifier"]](config), "partial_fit"):
+            raise ValueError(f"Классификатор '{config['classifier']}' не поддерживает инкрементальное обучение")
+        return config
+    
+    def _create_vectorizer(self):
+        """Новый (необученный) векторизатор текста"""
+        return text_features.create_vectorizer(self.model_config)
+    
+    def _create_classifier(self):
+        """Новый классификатор для одной головы модели"""
+        return CLASSIFIER_BACKENDS[self.model_config["classifier"]](self.model_config)
+    
+    def _swap_models(self, models, is_trained):
+        """Атомарная подмена всего набора моделей"""
+        with self._model_lock:
+            for name, model in models.items():
+                setattr(self, name, model)
+            self.is_trained = is_trained
+            self.model_version += 1
+            self.prediction_cache.clear()
+    
+    def _model_snapshot(self):
+        """Согласованный набор моделей для одного предсказания"""
+        with self._model_lock:
+            return {name: getattr(self, name) for name in MODEL_COMPONENTS}
+    
+    def _versioned_snapshot(self):
+        """Версия модели и набор моделей, взятые согласованно"""
+        with self._model_lock:
+            return self.model_version, {name: getattr(self, name) for name in MODEL_COMPONENTS}
+    
+    def predict(self, title, description, top_k=0):
+        """Предсказание группы, эксперта и метки с проверкой на спам и уверенность
+        
+        top_k > 0 добавляет в ответ top_k альтернативных групп, экспертов и меток с вероятностями.
+        """
+        
+        with registry.timer("predict"):
+            # 1. Проверка на спам перед предсказанием
+            with registry.timer("predict", "spam_check"):
+                is_spam, spam_message = self.spam_protector.is_spam(title, description)
+            if is_spam:
+                return self._spam_prediction(spam_message)
             
-            # 4. Проверка отдельных компонентов на низкую уверенность
-            low_confidence_components = []
-            if group_confidence < self.confidence_threshold:
-                low_confidence_components.append("группа")
-            if expert_confidence < self.confidence_threshold:
-                low_confidence_components.append("эксперт")
-            if label_confidence < self.confidence_threshold:
-                low_confidence_components.append("метка")
+            # 2. Проверка, обучена ли модель
+            if not self.is_trained:
+                return self._fallback_prediction(title, description)
+                
+            try:
+                full_text = f"{title}. {description}" if description else title
+                return self._predict_texts_cached([full_text], top_k)[0]
+                
+            except Exception as e:
+                registry.inc("errors_total", operation="predict")
+                print(f"❌ Ошибка предсказания: {e}")
+                return self._fallback_prediction(title, description)
+    
+    def predict_batch(self, items, top_k=0):
+        """Пакетное предсказание для списка заявок за один проход векторизации
+        
+        items - список словарей с полями 'title' и 'description'.
+        Возвращает список результатов в том же порядке и того же формата, что и predict.
+        """
+        with registry.timer("predict_batch"):
+            results = [None] * len(items)
+            texts = []
+            positions = []
             
-            if low_confidence_components and not needs_moderation:
-                needs_moderation = True
-                moderation_reason = f"Низкая уверенность в определении: {', '.join(low_confidence_components)}"
+            # 1. Проверка на спам сразу для всей пачки
+            with registry.timer("predict_batch", "spam_check"):
+                spam_checks = self.spam_protector.is_spam_batch(items)
             
-            result = {
-                "group": group,
-                "expert": expert,
-                "label": label,
-                "confidence": round(confidence, 3),
-                "group_confidence": round(group_confidence, 3),
-                "expert_confidence": round(expert_confidence, 3),
-                "label_confidence": round(label_confidence, 3),
-                "is_spam": False,
-                "needs_moderation": needs_moderation,
-                "moderation_reason": moderation_reason
-            }
+            for i, (item, (is_spam, spam_message)) in enumerate(zip(items, spam_checks)):
+                title = item.get('title', '')
+                description = item.get('description', '')
+                
+                if is_spam:
+                    results[i] = self._spam_prediction(spam_message)
+                    continue
+                
+                # 2. Без обученной модели отдаем резервное предсказание
+                if not self.is_trained:
+                    results[i] = self._fallback_prediction(title, description)
+                    continue
+                
+                texts.append(f"{title}. {description}" if description else title)
+                positions.append(i)
             
-            return result
+            if texts:
+                try:
+                    predictions = self._predict_texts_cached(texts, top_k)
+                except Exception as e:
+                    registry.inc("errors_total", operation="predict_batch")
+                    print(f"❌ Ошибка пакетного предсказания: {e}")
+                    predictions = [
+                        self._fallback_prediction(items[i].get('title', ''), items[i].get('description', ''))
+                        for i in positions
+                    ]
+                
+                for i, prediction in zip(positions, predictions):
+                    results[i] = prediction
             
+            return results
+    
+    def _predict_texts_cached(self, texts, top_k=0):
+        """Предсказание через кэш: модель вызывается только для текстов, которых нет в кэше"""
+        version, models = self._versioned_snapshot()
+        with registry.timer("inference", "cache_lookup"):
+            keys = [(version, self.confidence_threshold, top_k, self._normalize_text(text)) for text in texts]
+            results = [self.prediction_cache.get(key) for key in keys]
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            predictions = self._predict_texts([texts[i] for i in missing], top_k, models)
+            for i, prediction in zip(missing, predictions):
+                self.prediction_cache.put(keys[i], prediction)
+                results[i] = prediction
+        
+        # Копии, чтобы изменение ответа вызывающей стороной не портило кэш
+        return [dict(result) for result in results]
+    
+    @staticmethod
+    def _normalize_text(text):
+        """Нормализация для ключа кэша: регистр и пробелы не влияют на признаки модели"""
+        return " ".join(text.lower().split())
+    
+    def _predict_texts(self, texts, top_k=0, models=None):
+        """Предсказание для списка текстов: одна разреженная матрица и один вызов каждого классификатора"""
+        models = models or self._model_snapshot()
+        with registry.timer("inference", "vectorize"):
+            X = models["vectorizer"].transform(texts)
+        
+        # Один вызов predict_proba на голову (или один на все головы для multi-output модели)
+        if models["shared_classifier"] is not None:
+            with registry.timer("inference", "shared_classifier"):
+                probas = models["shared_classifier"].predict_proba(X)
+            classes = models["shared_classifier"].classes_
+        else:
+            probas = []
+            for _, _, name in HEADS:
+                with registry.timer("inference", name):
+                    probas.append(predict_proba(models[name], X))
+            classes = [models[name].classes_ for _, _, name in HEADS]
+        
+        with registry.timer("inference", "decode"):
+            groups, group_confidences, group_alternatives = self._predict_head(
+                probas[0], classes[0], models["group_encoder"], top_k)
+            experts, expert_confidences, expert_alternatives = self._predict_head(
+                probas[1], classes[1], models["expert_encoder"], top_k)
+            labels, label_confidences, label_alternatives = self._predict_head(
+                probas[2], classes[2], models["label_encoder"], top_k)
+        
+        results = []
+        for i in range(len(texts)):
+            result = self._build_prediction(groups[i], experts[i], labels[i],
+                                            group_confidences[i], expert_confidences[i], label_confidences[i])
+            if top_k > 0:
+                result["alternatives"] = {
+                    "group": group_alternatives[i],
+                    "expert": expert_alternatives[i],
+                    "label": label_alternatives[i]
+                }
+            results.append(result)
+        return results
+    
+    def _predict_head(self, proba, classes, encoder, top_k=0):
+        """Класс-победитель, уверенность и top_k альтернатив из вероятностей одной головы"""
+        rows = np.arange(proba.shape[0])
+        best = np.argmax(proba, axis=1)  # То же правило выбора, что и в classifier.predict
+        
+        class_names = encoder.classes_[classes]  # То же, что inverse_transform, без проверок на каждый вызов
+        names = class_names[best]
+        confidences = proba[rows, best]
+        
+        alternatives = None
+        if top_k > 0:
+            k = min(top_k, proba.shape[1])
+            top = np.argsort(-proba, axis=1, kind='stable')[:, :k]
+            alternatives = [
+                [{"name": class_names[j], "probability": round(float(proba[i, j]), 3)} for j in top[i]]
+                for i in rows
+            ]
+        
+        return names, confidences, alternatives
+    
+    def find_similar(self, title, description, top_k=5):
+        """top_k похожих исторических заявок (код, ссылка, эксперт, группа, близость)
+        
+        Пустой список, если модель не обучена, индекс выключен или заявка похожа на спам.
+        """
+        models = self._model_snapshot()
+        index = models["similarity_index"]
+        if index is None or top_k <= 0:
+            return []
+        if self.spam_protector.is_spam(title, description)[0]:
+            return []
+        
+        try:
+            full_text = f"{title}. {description}" if description else title
+            with registry.timer("similar", "search"):
+                return index.search(models["vectorizer"].transform([full_text]), top_k)
         except Exception as e:
-            print(f"❌ Ошибка предсказания: {e}")
-            return self._fallback_prediction(title, description)
+            registry.inc("errors_total", operation="similar")
+            print(f"❌ Ошибка поиска похожих заявок: {e}")
+            return []
+    
+    def _build_prediction(self, group, expert, label, group_confidence, expert_confidence, label_confidence):
+        """Формирование ответа с проверкой уверенности модели"""
+        confidence = min(group_confidence, expert_confidence, label_confidence)
+        
+        # 3. Проверка уверенности модели
+        needs_moderation = False
+        moderation_reason = ""
+        
+        if confidence < self.confidence_threshold:
+            needs_moderation = True
+            if confidence < 0.1:
+                moderation_reason = "Низкая уверенность модели: возможная опечатка или бессмысленный запрос"
+            else:
+                moderation_reason = f"Низкая уверенность модели ({confidence:.1%}) - требуется проверка человеком"
+        
+        # 4. Проверка отдельных компонентов на низкую уверенность
+        low_confidence_components = []
+        if group_confidence < self.confidence_threshold:
+            low_confidence_components.append("группа")
+        if expert_confidence < self.confidence_threshold:
+            low_confidence_components.append("эксперт")
+        if label_confidence < self.confidence_threshold:
+            low_confidence_components.append("метка")
+        
+        if low_confidence_components and not needs_moderation:
+            needs_moderation = True
+            moderation_reason = f"Низкая уверенность в определении: {', '.join(low_confidence_components)}"
+        
+        return {
+            "group": group,
+            "expert": expert,
+            "label": label,
+            "confidence": round(confidence, 3),
+            "group_confidence": round(group_confidence, 3),
+            "expert_confidence": round(expert_confidence, 3),
+            "label_confidence": round(label_confidence, 3),
+            "is_spam": False,
+            "needs_moderation": needs_moderation,
+            "moderation_reason": moderation_reason
+        }
+    
+    def _spam_prediction(self, spam_message):
+        """Ответ для заявки, заблокированной спам-фильтром"""
+        return {
+            "group": "СПАМ-ФИЛЬТР",
+            "expert": "Система защиты",
+            "label": "Заблокировано",
+            "confidence": 0.0,
+            "group_confidence": 0.0,
+            "expert_confidence": 0.0,
+            "label_confidence": 0.0,
+            "is_spam": True,
+            "spam_message": spam_message,
+            "message": "Запрос заблокирован спам-фильтром",
+            "needs_moderation": True,
+            "moderation_reason": "Обнаружен спам"
+        }
     
     def _fallback_prediction(self, title, description):
         """Резервное предсказание когда модель не обучена"""
@@ -177,70 +663,218 @@ class ModelManager:
         """Установка порога уверенности"""
         if 0 <= threshold <= 1:
             self.confidence_threshold = threshold
+            self.prediction_cache.clear()
             print(f"✅ Порог уверенности установлен: {threshold:.1%}")
             return True
         else:
             print("❌ Порог уверенности должен быть между 0 и 1")
             return False
     
-    def save_model(self, folder_path="model"):
-        """Сохранение модели и данных"""
+    def save_model(self, folder_path="model", compress=0):
+        """Сохранение модели одним файлом-бандлом с манифестом
+        
+        Без сжатия (compress=0) массивы numpy внутри бандла можно отобразить в память
+        при загрузке. compress=1..9 уменьшает файл, но отключает mmap.
+        """
+        if not self.is_trained:
+            # Например, модель очищена между обучением и сохранением
+            print("⚠️ Модель не обучена, сохранять нечего")
+            return False
         try:
+            start_time = time.perf_counter()
             os.makedirs(folder_path, exist_ok=True)
             
-            joblib.dump(self.vectorizer, os.path.join(folder_path, "vectorizer.joblib"))
-            joblib.dump(self.group_encoder, os.path.join(folder_path, "group_encoder.joblib"))
-            joblib.dump(self.expert_encoder, os.path.join(folder_path, "expert_encoder.joblib"))
-            joblib.dump(self.label_encoder, os.path.join(folder_path, "label_encoder.joblib"))
-            joblib.dump(self.group_classifier, os.path.join(folder_path, "group_classifier.joblib"))
-            joblib.dump(self.expert_classifier, os.path.join(folder_path, "expert_classifier.joblib"))
-            joblib.dump(self.label_classifier, os.path.join(folder_path, "label_classifier.joblib"))
+            model_id = uuid.uuid4().hex
+            bundle = {
+                "format_version": MODEL_FORMAT_VERSION,
+                "model_id": model_id,
+                "components": self._model_snapshot(),
+                "config": {
+                    'confidence_threshold': self.confidence_threshold,
+                    'model_config': self.trained_model_config
+                }
+            }
+            bundle_path = os.path.join(folder_path, MODEL_BUNDLE_FILE)
+            with registry.timer("save_model", "dump"):
+                joblib.dump(bundle, bundle_path + ".tmp", compress=compress)
+            os.replace(bundle_path + ".tmp", bundle_path)
+            # Загруженные записи и манифест файлов - до манифеста модели, который видят другие воркеры
+            with registry.timer("save_model", "ingestion_state"):
+                self.data_loader.save_state(folder_path)
             
-            # Сохраняем порог уверенности
-            config = {
-                'confidence_threshold': self.confidence_threshold
+            manifest = {
+                "format_version": MODEL_FORMAT_VERSION,
+                "model_id": model_id,
+                "created_at": datetime.now().isoformat(),
+                "bundle_file": MODEL_BUNDLE_FILE,
+                "bundle_size": os.path.getsize(bundle_path),
+                "compress": compress,
+                "components": [name for name, model in bundle["components"].items() if model is not None],
+                "confidence_threshold": self.confidence_threshold,
+                "model_config": self.trained_model_config,
+                "last_training": self.last_training_info,
+                "sklearn_version": sklearn.__version__
             }
-            joblib.dump(config, os.path.join(folder_path, "config.joblib"))
+            manifest_path = os.path.join(folder_path, MODEL_MANIFEST_FILE)
+            with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            self.model_id = model_id
+            self._manifest_mtime_ns = os.stat(manifest_path).st_mtime_ns
             
+            # Файлы прежнего формата (по файлу на компонент) больше не нужны
+            for name in MODEL_COMPONENTS + ["config"]:
+                legacy_path = os.path.join(folder_path, f"{name}.joblib")
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
+            
+            registry.observe("stage_duration_seconds", time.perf_counter() - start_time,
+                             operation="save_model", stage="total")
             print(f"💾 Модель сохранена в папку {folder_path}")
             return True
         except Exception as e:
+            registry.inc("errors_total", operation="save_model")
             print(f"❌ Ошибка сохранения модели: {e}")
             return False
     
-    def load_model(self, folder_path="model"):
-        """Загрузка модели"""
+    def load_model(self, folder_path="model", mmap_mode="r"):
+        """Загрузка модели
+        
+        Бандл загружается с mmap_mode: numpy-массивы (idf, коэффициенты линейных моделей)
+        читаются с диска по требованию и разделяются процессами через страничный кэш.
+        Узлы деревьев RandomForest sklearn при загрузке всегда копирует в свою память.
+        Во время обучения ждет его окончания, иначе обучение подменило бы загруженную модель.
+        """
+        with self._training_lock:
+            return self._load_model(folder_path, mmap_mode)
+    
+    def _load_model(self, folder_path, mmap_mode="r"):
+        """Загрузка модели (вызывающий держит _training_lock)"""
         try:
-            self.vectorizer = joblib.load(os.path.join(folder_path, "vectorizer.joblib"))
-            self.group_encoder = joblib.load(os.path.join(folder_path, "group_encoder.joblib"))
-            self.expert_encoder = joblib.load(os.path.join(folder_path, "expert_encoder.joblib"))
-            self.label_encoder = joblib.load(os.path.join(folder_path, "label_encoder.joblib"))
-            self.group_classifier = joblib.load(os.path.join(folder_path, "group_classifier.joblib"))
-            self.expert_classifier = joblib.load(os.path.join(folder_path, "expert_classifier.joblib"))
-            self.label_classifier = joblib.load(os.path.join(folder_path, "label_classifier.joblib"))
+            start_time = time.perf_counter()
+            manifest_path = os.path.join(folder_path, MODEL_MANIFEST_FILE)
+            if not os.path.exists(manifest_path):
+                return self._load_legacy_model(folder_path)
             
-            # Загружаем порог уверенности
-            try:
-                config = joblib.load(os.path.join(folder_path, "config.joblib"))
-                self.confidence_threshold = config.get('confidence_threshold', 0.25)
-            except:
-                self.confidence_threshold = 0.25
+            manifest_mtime_ns = os.stat(manifest_path).st_mtime_ns
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["format_version"] > MODEL_FORMAT_VERSION:
+                raise ValueError(f"Неподдерживаемая версия формата модели: {manifest['format_version']}")
+            
+            with registry.timer("load_model", "load_bundle"):
+                bundle = joblib.load(os.path.join(folder_path, manifest["bundle_file"]),
+                                     mmap_mode=mmap_mode if not manifest.get("compress") else None)
+            config = bundle["config"]
+            self.confidence_threshold = config.get('confidence_threshold', 0.25)
+            self.trained_model_config = self._resolve_model_config(config.get('model_config'))
+            self.last_training_info = manifest.get("last_training")
             
-            self.is_trained = True
+            self._swap_models({name: bundle["components"].get(name) for name in MODEL_COMPONENTS}, is_trained=True)
+            with registry.timer("load_model", "ingestion_state"):
+                self.data_loader.load_state(folder_path)
+            self.model_id = bundle.get("model_id")
+            self._manifest_mtime_ns = manifest_mtime_ns
+            registry.observe("stage_duration_seconds", time.perf_counter() - start_time,
+                             operation="load_model", stage="total")
             print(f"📂 Модель загружена из папки {folder_path}")
             print(f"📊 Порог уверенности: {self.confidence_threshold:.1%}")
             return True
         except Exception as e:
+            registry.inc("errors_total", operation="load_model")
             print(f"❌ Ошибка загрузки модели: {e}")
             return False
+    
+    def reload_if_changed(self, folder_path="model", force=False):
+        """Подхватить модель, сохраненную другим процессом (воркером gunicorn)
+        
+        Проверка - один stat манифеста не чаще раза в sync_interval секунд (force=True - сразу,
+        без учета интервала). Если манифест удален (/clear_model в другом воркере), модель
+        в памяти тоже очищается. Возвращает True, если модель была перезагружена или очищена.
+        """
+        now = time.monotonic()
+        if not force and (self.sync_interval <= 0 or now - self._last_sync_check < self.sync_interval):
+            return False
+        self._last_sync_check = now
+        
+        manifest_path = os.path.join(folder_path, MODEL_MANIFEST_FILE)
+        try:
+            mtime_ns = os.stat(manifest_path).st_mtime_ns
+            if mtime_ns == self._manifest_mtime_ns:
+                return False
+            with open(manifest_path, encoding="utf-8") as f:
+                model_id = json.load(f).get("model_id")
+        except FileNotFoundError:
+            # Манифест был, а теперь удален (/clear_model в другом воркере) - очищаем и свою модель
+            if self._manifest_mtime_ns is None:
+                return False
+            return self._forget_deleted_model()
+        except (OSError, ValueError):
+            return False
+        
+        if model_id == self.model_id:
+            self._manifest_mtime_ns = mtime_ns
+            return False
+        if not self._training_lock.acquire(blocking=False):
+            # Этот процесс сам обучает модель и сохранит свою версию
+            return False
+        try:
+            print(f"🔄 На диске новая модель {model_id}, загружаем")
+            return self._load_model(folder_path)
+        finally:
+            self._training_lock.release()
+    
+    def _forget_deleted_model(self):
+        """Сбросить модель в памяти, удаленную с диска другим процессом"""
+        if not self._training_lock.acquire(blocking=False):
+            # Этот процесс сам обучает модель и сохранит свою версию
+            return False
+        try:
+            print("🧹 Модель удалена с диска, очищаем модель в памяти")
+            self._reset_model()
+            return True
+        finally:
+            self._training_lock.release()
+    
+    def _load_legacy_model(self, folder_path):
+        """Загрузка модели прежнего формата: отдельный .joblib на каждый компонент"""
+        models = {}
+        for name in MODEL_COMPONENTS:
+            path = os.path.join(folder_path, f"{name}.joblib")
+            if name in OPTIONAL_COMPONENTS and not os.path.exists(path):
+                # Модели, сохраненные до появления multi-output режима и индекса похожих заявок
+                models[name] = None
+            else:
+                models[name] = joblib.load(path)
+        
+        # Загружаем порог уверенности
+        try:
+            config = joblib.load(os.path.join(folder_path, "config.joblib"))
+            self.confidence_threshold = config.get('confidence_threshold', 0.25)
+            self.trained_model_config = self._resolve_model_config(config.get('model_config'))
+        except:
+            self.confidence_threshold = 0.25
+            self.trained_model_config = None
+        
+        self._swap_models(models, is_trained=True)
+        self.data_loader.load_state(folder_path)
+        print(f"📂 Модель (прежний формат) загружена из папки {folder_path}")
+        print(f"📊 Порог уверенности: {self.confidence_threshold:.1%}")
+        return True
 
     # Остальные методы остаются без изменений...
     def clear_model(self, folder_path="model"):
-        """Очистка модели - удаление всех файлов"""
+        """Очистка модели - удаление всех файлов
+        
+        Во время обучения ждет его окончания: иначе обучение вернуло бы модель после очистки.
+        """
+        with self._training_lock:
+            return self._clear_model(folder_path)
+    
+    def _clear_model(self, folder_path):
         try:
             if not os.path.exists(folder_path):
                 print(f"📭 Папка {folder_path} не существует")
-                return True
                 
             files = glob.glob(os.path.join(folder_path, "*"))
             for file in files:
@@ -250,23 +884,9 @@ class ModelManager:
                 except Exception as e:
                     print(f"⚠️ Не удалось удалить файл {file}: {e}")
             
-            self.vectorizer = TfidfVectorizer(max_features=1500, stop_words=['и', 'в', 'на', 'с', 'по', 'для', 'за', 'к'])
-            self.group_encoder = LabelEncoder()
-            self.expert_encoder = LabelEncoder()
-            self.label_encoder = LabelEncoder()
-            
-            self.group_classifier = None
-            self.expert_classifier = None
-            self.label_classifier = None
-            
-            self.data_loader.historical_data = []
-            self.data_loader.groups = set()
-            self.data_loader.experts = set()
-            self.data_loader.labels = set()
-            
-            self.is_trained = False
-            self.confidence_threshold = 0.25
-            
+            self._reset_model()
+            if self.data_loader.excel_cache:
+                self.data_loader.excel_cache.clear()
             print(f"🧹 Модель полностью очищена. Удалено {len(files)} файлов.")
             return True
             
@@ -274,6 +894,29 @@ class ModelManager:
             print(f"❌ Ошибка очистки модели: {e}")
             return False
     
+    def _reset_model(self):
+        """Забыть модель в памяти: необученное состояние, как у нового ModelManager"""
+        self._swap_models({
+            "vectorizer": self._create_vectorizer(),
+            "group_encoder": LabelEncoder(),
+            "expert_encoder": LabelEncoder(),
+            "label_encoder": LabelEncoder(),
+            "group_classifier": None,
+            "expert_classifier": None,
+            "label_classifier": None,
+            "shared_classifier": None,
+            "similarity_index": None
+        }, is_trained=False)
+        
+        # Вместе с моделью забываем загруженные записи и файлы, иначе они не перечитаются
+        self.data_loader.clear()
+        
+        self.confidence_threshold = 0.25
+        self.trained_model_config = None
+        self.last_training_info = None
+        self.model_id = None
+        self._manifest_mtime_ns = None
+    
     def get_data_stats(self):
         """Получить статистику данных"""
         return self.data_loader.get_stats()
@@ -307,5 +950,9 @@ class ModelManager:
             "groups": self.group_encoder.classes_.tolist(),
             "experts": self.expert_encoder.classes_.tolist(),
             "labels": self.label_encoder.classes_.tolist(),
-            "confidence_threshold": self.confidence_threshold
+            "confidence_threshold": self.confidence_threshold,
+            "model_config": self.model_config,
+            "trained_model_config": self.trained_model_config,
+            "last_training": self.last_training_info,
+            "similarity_index": self.similarity_index.get_info() if self.similarity_index is not None else None
         }
\ No newline at end of file
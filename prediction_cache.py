@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Ограниченный LRU-кэш предсказаний с временем жизни записей
+
+    Ключ строится вызывающей стороной и должен включать версию модели,
+    чтобы после подмены модели старые ответы не возвращались.
+    max_size=0 отключает кэш.
+    """
+
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Значение по ключу или None (промах, истекшая запись или кэш выключен)"""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Удалить все записи (счетчики попаданий сохраняются)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_info(self):
+        """Статистика кэша"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_size > 0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
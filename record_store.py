@@ -0,0 +1,378 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+class StringColumn:
+    """Столбец строк в одном utf-8 буфере со смещениями
+
+    В отличие от списка str хранится двумя numpy-массивами: без отдельного объекта
+    на каждую строку и без копирования в память каждого воркера при загрузке с mmap_mode.
+    """
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def concat(cls, columns):
+        columns = list(columns)
+        if not columns:
+            return cls.from_values([])
+        # Столбец может быть срезом чужого буфера: берем только его байты
+        buffers = [column.buffer[column.offsets[0]:column.offsets[-1]] for column in columns]
+        shifts = np.cumsum([0] + [len(buffer) for buffer in buffers[:-1]])
+        offsets = [np.zeros(1, dtype=np.int64)] + [column.offsets[1:] - column.offsets[0] + shift
+                                                   for column, shift in zip(columns, shifts)]
+        return cls(np.concatenate(buffers), np.concatenate(offsets))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.buffer[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        # Один decode на весь буфер быстрее, чем по строке
+        text = bytes(self.buffer[self.offsets[0]:self.offsets[-1]])
+        bounds = (self.offsets - self.offsets[0]).tolist()
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            yield text[start:end].decode("utf-8")
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + self.offsets.nbytes
+
+    def take(self, order):
+        """Столбец со строками в порядке order"""
+        lengths = np.diff(self.offsets)[order]
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Позиции байтов каждой строки в исходном буфере
+        starts = np.repeat(self.offsets[:-1][order] - offsets[:-1], lengths)
+        return StringColumn(self.buffer[starts + np.arange(offsets[-1])], offsets)
+
+    def append(self, other):
+        return StringColumn.concat([self, other])
+
+
+class CategoryColumn:
+    """Столбец повторяющихся строк: коды в numpy-массиве и список уникальных значений"""
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values):
+        codes, categories = pd.factorize(pd.Series(values, dtype=object), sort=True)
+        return cls(codes.astype(np.int32), list(categories))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.categories[self.codes[i]]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def take(self, order):
+        return CategoryColumn(self.codes[order], self.categories)
+
+    def append(self, other):
+        positions = {value: code for code, value in enumerate(self.categories)}
+        categories = list(self.categories)
+        mapping = np.empty(len(other.categories), dtype=np.int32)
+        for code, value in enumerate(other.categories):
+            if value not in positions:
+                positions[value] = len(categories)
+                categories.append(value)
+            mapping[code] = positions[value]
+        return CategoryColumn(np.concatenate([self.codes, mapping[other.codes]]), categories)
+
+
+def _value_array(values):
+    """Компактный массив для кода заявки и времени закрытия
+
+    Целые числа - int64, даты - datetime64 (NaT вместо пропусков), остальное - как есть.
+    """
+    if all(isinstance(value, (int, np.integer)) and not isinstance(value, bool) for value in values):
+        return np.array(values, dtype=np.int64)
+    if all(value is None or isinstance(value, pd.Timestamp) for value in values):
+        return pd.DatetimeIndex(values).values
+    return np.array(values, dtype=object)
+
+
+def _python_values(array):
+    """Значения массива из _value_array в том виде, в каком они были в записях"""
+    if array.dtype.kind == "M":
+        return [None if pd.isna(value) else value for value in pd.DatetimeIndex(array)]
+    return array.tolist()
+
+
+def _nbytes(value):
+    """Размер массивов (numpy, разреженных, StringColumn) в значении кэша блока"""
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    if sp.issparse(value):
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    return getattr(value, "nbytes", 0)
+
+
+class RecordStore:
+    """Колоночное хранилище исторических заявок
+
+    Каждая загрузка добавляет блок (append без копирования уже загруженных данных).
+    Тексты блока лежат в utf-8 буферах, группа/эксперт/метка/файл - кодами int32
+    по общим для хранилища справочникам. full_text не хранится, а собирается из
+    заголовка и описания при чтении.
+
+    Логический порядок записей - новые блоки первыми, как у прежнего списка
+    historical_data, куда новые записи добавлялись в начало. Индексация и итерация
+    возвращают записи-словари прежнего формата.
+    """
+
+    TEXT_FIELDS = ["title", "description", "url"]
+    CATEGORY_FIELDS = ["expert", "group", "label", "source_file"]
+    VALUE_FIELDS = ["code", "close_time"]
+    RECORD_FIELDS = ['code', 'close_time', 'title', 'expert', 'description',
+                     'group', 'label', 'url', 'full_text', 'source_file']
+
+    def __init__(self, records=None):
+        self._chunks = []  # В порядке добавления
+        self._categories = {field: [] for field in self.CATEGORY_FIELDS}
+        self._category_codes = {field: {} for field in self.CATEGORY_FIELDS}
+        if records:
+            self.append(records)
+
+    def append(self, records):
+        """Добавить записи блоком; в логическом порядке они окажутся перед всеми прежними"""
+        return self.extend([records])
+
+    def extend(self, batches):
+        """Добавить одной загрузкой несколько порций записей (например, при потоковом чтении)
+
+        Каждая порция сразу переводится в столбцы, поэтому словари записей не накапливаются.
+        В логическом порядке порции идут друг за другом в порядке batches и перед прежними
+        записями. Блоки добавляются в хранилище только после чтения всех порций.
+        Возвращает число добавленных записей.
+        """
+        chunks = [self._build_chunk(records) for records in batches]
+        chunks = [chunk for chunk in chunks if chunk["size"]]
+        self._chunks.extend(reversed(chunks))
+        return sum(chunk["size"] for chunk in chunks)
+
+    def clear(self):
+        self.__init__()
+
+    def __len__(self):
+        return sum(chunk["size"] for chunk in self._chunks)
+
+    def __bool__(self):
+        return bool(self._chunks)
+
+    def __iter__(self):
+        for chunk in reversed(self._chunks):
+            yield from self._chunk_records(chunk, 0, chunk["size"])
+
+    def __getitem__(self, key):
+        """Запись по номеру или список записей по срезу"""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            records = []
+            for chunk, chunk_start, chunk_stop in self._chunk_ranges(start, stop):
+                records.extend(self._chunk_records(chunk, chunk_start, chunk_stop))
+            return records
+
+        index = key + len(self) if key < 0 else key
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        for chunk, chunk_start, _ in self._chunk_ranges(index, index + 1):
+            return next(self._chunk_records(chunk, chunk_start, chunk_start + 1))
+
+    def remove(self, field, values):
+        """Удалить записи, у которых значение категориального поля входит в values
+
+        Возвращает число удаленных записей. Блоки без таких записей не копируются.
+        """
+        codes = [self._category_codes[field][value] for value in values if value in self._category_codes[field]]
+        if not codes:
+            return 0
+        removed = 0
+        chunks = []
+        for chunk in self._chunks:
+            keep = ~np.isin(chunk[field], codes)
+            if keep.all():
+                chunks.append(chunk)
+                continue
+            removed += chunk["size"] - int(keep.sum())
+            if keep.any():
+                chunks.append(self._take_chunk(chunk, np.flatnonzero(keep)))
+        self._chunks = chunks
+        return removed
+
+    def newest(self, count):
+        """Хранилище из count последних добавленных записей (блоки общие, без копирования)"""
+        store = RecordStore()
+        store._categories = self._categories
+        store._category_codes = self._category_codes
+        remaining = count
+        for chunk in reversed(self._chunks):
+            if remaining <= 0:
+                break
+            if chunk["size"] > remaining:
+                chunk = self._slice_chunk(chunk, chunk["size"] - remaining, chunk["size"])
+            store._chunks.insert(0, chunk)
+            remaining -= chunk["size"]
+        return store
+
+    def column(self, field):
+        """Значения поля всех записей в логическом порядке (список строк или значений)"""
+        if field == "full_text":
+            return list(self.iter_full_text())
+        chunks = list(reversed(self._chunks))
+        if field in self.CATEGORY_FIELDS:
+            categories = np.array(self._categories[field], dtype=object)
+            return categories[self.codes(field)].tolist()
+        if field in self.TEXT_FIELDS:
+            return [value for chunk in chunks for value in chunk[field]]
+        return [value for chunk in chunks for value in _python_values(chunk[field])]
+
+    def string_column(self, field):
+        """Текстовое поле одним StringColumn в логическом порядке"""
+        return StringColumn.concat(chunk[field] for chunk in reversed(self._chunks))
+
+    def codes(self, field):
+        """Коды категориального поля в логическом порядке (индексы в categories(field))"""
+        return np.concatenate([chunk[field] for chunk in reversed(self._chunks)] or [np.zeros(0, np.int32)])
+
+    def categories(self, field):
+        """Все значения категориального поля в порядке появления"""
+        return list(self._categories[field])
+
+    def unique(self, field):
+        """Значения категориального поля, которые есть в записях хранилища"""
+        if not self._chunks:
+            return set()
+        present = np.unique(self.codes(field))
+        return {self._categories[field][code] for code in present}
+
+    def encode(self, field):
+        """(отсортированные значения, коды записей) - то же, что LabelEncoder.fit_transform(column(field))"""
+        codes = self.codes(field)
+        present = np.unique(codes)
+        values = [self._categories[field][code] for code in present]
+        order = sorted(range(len(values)), key=values.__getitem__)
+        classes = np.array([values[i] for i in order], dtype=object)
+        rank = np.zeros(len(self._categories[field]), dtype=np.int64)
+        rank[present[order]] = np.arange(len(order))
+        return classes, rank[codes]
+
+    def map_chunks(self, key, func):
+        """func(тексты блока) для каждого блока в логическом порядке, с кэшем результата в блоке
+
+        Блоки не меняются после добавления, поэтому результат (например, счетчики токенов)
+        действителен, пока блок в хранилище, и сохраняется вместе с записями.
+        """
+        results = []
+        for chunk in reversed(self._chunks):
+            cache = chunk.setdefault("cache", {})
+            if key not in cache:
+                cache[key] = func(self._chunk_full_text(chunk))
+            results.append(cache[key])
+        return results
+
+    def iter_full_text(self):
+        """Заголовок и описание, объединенные так же, как при парсинге выгрузки"""
+        for chunk in reversed(self._chunks):
+            yield from self._chunk_full_text(chunk)
+
+    def get_info(self):
+        """Размер хранилища в памяти"""
+        size = cache_size = 0
+        for chunk in self._chunks:
+            size += sum(chunk[field].nbytes for field in self.TEXT_FIELDS + self.CATEGORY_FIELDS + self.VALUE_FIELDS)
+            cache_size += sum(_nbytes(value) for value in chunk.get("cache", {}).values())
+        return {"records": len(self), "chunks": len(self._chunks), "size_mb": round(size / 2 ** 20, 2),
+                "cache_mb": round(cache_size / 2 ** 20, 2)}
+
+    def _build_chunk(self, records):
+        """Блок столбцов из списка записей (коды категорий - по общим справочникам)"""
+        records = list(records)
+        chunk = {"size": len(records)}
+        for field in self.TEXT_FIELDS:
+            chunk[field] = StringColumn.from_values([record.get(field) or "" for record in records])
+        for field in self.CATEGORY_FIELDS:
+            chunk[field] = self._encode(field, [record.get(field) or "" for record in records])
+        for field in self.VALUE_FIELDS:
+            chunk[field] = _value_array([record.get(field) for record in records])
+        return chunk
+
+    @staticmethod
+    def _chunk_full_text(chunk):
+        for title, description in zip(chunk["title"], chunk["description"]):
+            yield f"{title}. {description}" if description else title
+
+    def _encode(self, field, values):
+        """Коды значений по справочнику поля (новые значения добавляются в справочник)"""
+        local_codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        codes = self._category_codes[field]
+        categories = self._categories[field]
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(categories)
+                categories.append(value)
+            mapping[i] = code
+        return mapping[local_codes]
+
+    def _chunk_ranges(self, start, stop):
+        """(блок, начало, конец) для записей [start, stop) логического порядка"""
+        position = 0
+        for chunk in reversed(self._chunks):
+            chunk_start, chunk_stop = max(start - position, 0), min(stop - position, chunk["size"])
+            if chunk_start < chunk_stop:
+                yield chunk, chunk_start, chunk_stop
+            position += chunk["size"]
+            if position >= stop:
+                break
+
+    def _chunk_records(self, chunk, start, stop):
+        part = self._slice_chunk(chunk, start, stop) if (start, stop) != (0, chunk["size"]) else chunk
+        columns = {field: list(part[field]) for field in self.TEXT_FIELDS}
+        columns.update({field: [self._categories[field][code] for code in part[field]]
+                        for field in self.CATEGORY_FIELDS})
+        columns.update({field: _python_values(part[field]) for field in self.VALUE_FIELDS})
+        columns["full_text"] = [f"{title}. {description}" if description else title
+                                for title, description in zip(columns["title"], columns["description"])]
+        for values in zip(*(columns[field] for field in self.RECORD_FIELDS)):
+            yield dict(zip(self.RECORD_FIELDS, values))
+
+    def _slice_chunk(self, chunk, start, stop):
+        part = {"size": stop - start}
+        for field in self.TEXT_FIELDS:
+            column = chunk[field]
+            part[field] = StringColumn(column.buffer, column.offsets[start:stop + 1])
+        for field in self.CATEGORY_FIELDS + self.VALUE_FIELDS:
+            part[field] = chunk[field][start:stop]
+        return part
+
+    def _take_chunk(self, chunk, rows):
+        part = {"size": len(rows)}
+        for field in self.TEXT_FIELDS:
+            part[field] = chunk[field].take(rows)
+        for field in self.CATEGORY_FIELDS + self.VALUE_FIELDS:
+            part[field] = chunk[field][rows]
+        return part
@@ -0,0 +1,188 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.cluster import MiniBatchKMeans
+from record_store import RecordStore, StringColumn, CategoryColumn
+
+
+def _format_value(value):
+    """Код заявки и время закрытия как строки для ответа API ("" - пропуск)"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value).strip()
+
+
+class SimilarTicketsIndex:
+    """Поиск похожих исторических заявок по TF-IDF векторам
+
+    Векторы заявок хранятся нормированной CSR-матрицей, близость запроса - скалярное
+    произведение (косинус). Для больших историй строки разбиваются на кластеры
+    (k-means, по ~sqrt(n) заявок) и упорядочиваются по ним: запрос сравнивается с
+    центроидами и точно оценивает только заявки n_probe ближайших кластеров
+    (приближенный поиск, как IVF). Небольшие истории просматриваются целиком.
+    """
+
+    # Строковые поля записи, уникальные для заявки, и поля с повторяющимися значениями
+    STRING_FIELDS = ["code", "title", "url", "close_time"]
+    CATEGORY_FIELDS = ["group", "expert", "label"]
+    # До стольких записей поиск точный, по всей матрице
+    EXACT_SEARCH_MAX_ROWS = 200000
+    # Сколько ближайших кластеров просматривать при приближенном поиске
+    N_PROBE = 16
+    # Строк на одну порцию при отнесении заявок к кластерам (ограничивает память)
+    ASSIGN_CHUNK_ROWS = 20000
+
+    def __init__(self, matrix, columns, centroids=None, cluster_offsets=None):
+        self.matrix = matrix
+        self.columns = columns
+        self.centroids = centroids
+        self.cluster_offsets = cluster_offsets
+
+    @classmethod
+    def build(cls, X, records, n_clusters=None):
+        """Индекс по матрице признаков X (строки - записи records в том же порядке)
+
+        n_clusters=None - точный поиск для небольших историй и ~sqrt(n) кластеров для больших.
+        """
+        X = cls._normalized(X)
+        if n_clusters is None:
+            n_clusters = int(np.sqrt(X.shape[0])) if X.shape[0] > cls.EXACT_SEARCH_MAX_ROWS else 0
+        if n_clusters <= 1:
+            return cls(X, cls._columns(records))
+
+        centroids = cls._fit_centroids(X, n_clusters)
+        return cls._clustered(X, records, centroids)
+
+    def add(self, X, records):
+        """Новый индекс с добавленными записями (старый не меняется - его может читать predict)
+
+        Центроиды не пересчитываются: новые заявки относятся к ближайшим существующим кластерам.
+        """
+        X = self._normalized(X)
+        if self.centroids is None:
+            matrix = sp.vstack([self.matrix, X], format="csr")
+            new_columns = self._columns(records)
+            return SimilarTicketsIndex(matrix, {name: column.append(new_columns[name])
+                                                for name, column in self.columns.items()})
+
+        # Старые записи уже упорядочены по кластерам: их кластер известен по смещениям
+        old_labels = np.repeat(np.arange(len(self.centroids)), np.diff(self.cluster_offsets))
+        labels = np.concatenate([old_labels, self._assign(X, self.centroids)])
+        order = np.argsort(labels, kind="stable")
+        new_columns = self._columns(records)
+        columns = {name: column.append(new_columns[name]).take(order) for name, column in self.columns.items()}
+        matrix = sp.vstack([self.matrix, X], format="csr")[order]
+        return SimilarTicketsIndex(matrix, columns, self.centroids,
+                                   self._offsets(labels[order], len(self.centroids)))
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, X_query, top_k=5):
+        """top_k самых близких заявок к первой строке X_query (с близостью > 0)"""
+        query = np.asarray(X_query[:1].toarray(), dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm == 0 or top_k <= 0:
+            return []
+        query /= norm
+
+        if self.centroids is None:
+            rows = np.arange(len(self))
+            scores = self.matrix @ query
+        else:
+            # Точная оценка только заявок ближайших кластеров
+            n_probe = min(self.N_PROBE, len(self.centroids))
+            nearest = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+            rows = np.concatenate([np.arange(self.cluster_offsets[c], self.cluster_offsets[c + 1])
+                                   for c in nearest])
+            scores = self._score_rows(rows, query)
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((rows[top], -scores[top]))]
+        return [self._ticket(rows[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def _score_rows(self, rows, query):
+        """matrix[rows] @ query напрямую по массивам CSR, без создания подматрицы
+
+        rows - подряд идущие диапазоны строк (кластеры), поэтому ненулевые элементы
+        каждой строки берутся одним срезом data/indices.
+        """
+        indptr = self.matrix.indptr
+        lengths = indptr[rows + 1] - indptr[rows]
+        row_ends = np.cumsum(lengths)
+        # Позиции ненулевых элементов всех строк подряд
+        positions = np.repeat(indptr[rows] - (row_ends - lengths), lengths) + np.arange(row_ends[-1])
+        contributions = self.matrix.data[positions] * query[self.matrix.indices[positions]]
+        cumulative = np.concatenate(([0.0], np.cumsum(contributions, dtype=np.float64)))
+        return cumulative[row_ends] - cumulative[row_ends - lengths]
+
+    def get_info(self):
+        size = self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+        size += sum(column.nbytes for column in self.columns.values())
+        if self.centroids is not None:
+            size += self.centroids.nbytes
+        return {
+            "records": len(self),
+            "clusters": len(self.centroids) if self.centroids is not None else 0,
+            "size_mb": round(size / 2 ** 20, 2)
+        }
+
+    def _ticket(self, i, similarity):
+        ticket = {name: self.columns[name][i] or None for name in self.STRING_FIELDS + self.CATEGORY_FIELDS}
+        ticket["similarity"] = round(similarity, 3)
+        return ticket
+
+    @classmethod
+    def _clustered(cls, X, records, centroids):
+        """Индекс со строками, упорядоченными по ближайшему центроиду"""
+        labels = cls._assign(X, centroids)
+        order = np.argsort(labels, kind="stable")
+        columns = {name: column.take(order) for name, column in cls._columns(records).items()}
+        return cls(X[order], columns, centroids, cls._offsets(labels[order], len(centroids)))
+
+    @staticmethod
+    def _fit_centroids(X, n_clusters, sample_size=100000):
+        """Нормированные центроиды k-means по случайной выборке строк (сферический k-means)"""
+        rng = np.random.default_rng(42)
+        sample = X[rng.choice(X.shape[0], min(sample_size, X.shape[0]), replace=False)]
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=4096, n_init=1, max_no_improvement=5,
+                                 random_state=42).fit(sample)
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return centroids / norms
+
+    @classmethod
+    def _assign(cls, X, centroids):
+        """Ближайший по косинусу центроид для каждой строки X (порциями)"""
+        return np.concatenate([np.asarray(np.argmax(X[start:start + cls.ASSIGN_CHUNK_ROWS] @ centroids.T, axis=1))
+                               .ravel() for start in range(0, X.shape[0], cls.ASSIGN_CHUNK_ROWS)]
+                              or [np.zeros(0, dtype=np.int64)])
+
+    @staticmethod
+    def _offsets(sorted_labels, n_clusters):
+        return np.searchsorted(sorted_labels, np.arange(n_clusters + 1))
+
+    @staticmethod
+    def _normalized(X):
+        """Строки X с единичной L2-нормой в float32 (TF-IDF уже нормирован, хэши - нет)"""
+        X = sp.csr_matrix(X, dtype=np.float32)
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sp.diags(1 / norms).astype(np.float32) @ X
+
+    @classmethod
+    def _columns(cls, records):
+        """Поля заявок для ответа из RecordStore (или списка записей) в порядке строк матрицы"""
+        if not isinstance(records, RecordStore):
+            records = RecordStore(records)
+        columns = {name: StringColumn.from_values([_format_value(value) for value in records.column(name)])
+                   for name in ["code", "close_time"]}
+        columns.update({name: records.string_column(name) for name in ["title", "url"]})
+        columns.update({name: CategoryColumn(records.codes(name), records.categories(name))
+                        for name in cls.CATEGORY_FIELDS})
+        return columns
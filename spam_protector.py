@@ -1,13 +1,36 @@
 import re
+import numpy as np
+
+# Признаки явной бессмыслицы (проверяются по тексту в нижнем регистре)
+GIBBERISH_PATTERNS = [
+    r'[a-z]{20,}',  # ОЧЕНЬ длинные последовательности латиницы
+    r'[0-9]{20,}',  # ОЧЕНЬ длинные последовательности цифр
+    r'[!@#$%^&*()_+\-={}\[\]|:;"<>,.?/~`]{10,}',  # Много спецсимволов
+    r'(.)\1{10,}',  # Повторяющиеся символы (aaaaaaaaaaa)
+]
+# Те же признаки для векторной проверки: класс ASCII-символа и минимальная длина его серии
+SPECIAL_CHARS = '!@#$%^&*()_+-={}[]|:;"<>,.?/~`'
+NO_RUN = np.iinfo(np.int64).max
+ASCII_CLASSES = np.zeros(129, dtype=np.uint8)  # Индекс 128 - все символы вне ASCII (класс 0)
+ASCII_CLASSES[ord('a'):ord('z') + 1] = 1
+ASCII_CLASSES[ord('0'):ord('9') + 1] = 2
+ASCII_CLASSES[[ord(ch) for ch in SPECIAL_CHARS]] = 3
+CLASS_RUN_LENGTHS = np.array([NO_RUN, 20, 20, 10])
+REPEATED_CHAR_RUN = 11
+NEWLINE_CODE = ord('\n')  # "." в регулярном выражении не совпадает с \n: его повторы не бессмыслица
+SEPARATOR_CODE = 0x110000  # Больше любого кода Unicode
+
+MIN_TEXT_LENGTH = 5
+MAX_TEXT_LENGTH = 2000
+# Меньшие пачки проверяются по одной заявке: накладные расходы numpy не окупаются
+MIN_VECTORIZED_BATCH = 8
+
 
 class SpamProtector:
     def __init__(self):
-        self.gibberish_patterns = [
-            r'[a-z]{20,}',  # ОЧЕНЬ длинные последовательности латиницы
-            r'[0-9]{20,}',  # ОЧЕНЬ длинные последовательности цифр
-            r'[!@#$%^&*()_+\-={}\[\]|:;"<>,.?/~`]{10,}',  # Много спецсимволов
-            r'(.)\1{10,}',  # Повторяющиеся символы (aaaaaaaaaaa)
-        ]
+        self.gibberish_patterns = GIBBERISH_PATTERNS
+        # Шаблоны компилируются один раз, а не при каждом вызове re.search
+        self._gibberish_searches = [re.compile(pattern).search for pattern in GIBBERISH_PATTERNS]
     
     def is_spam(self, title, description):
         """Упрощенная проверка на бред"""
@@ -15,11 +38,11 @@ class SpamProtector:
         full_text = full_text.strip()
         
         # 1. Проверка на слишком короткий текст
-        if len(full_text) < 5:
+        if len(full_text) < MIN_TEXT_LENGTH:
             return True, "Слишком короткий запрос. Минимум 5 символов."
         
         # 2. Проверка на слишком длинный текст
-        if len(full_text) > 2000:
+        if len(full_text) > MAX_TEXT_LENGTH:
             return True, "Слишком длинный запрос. Максимум 2000 символов."
         
         # 3. Проверка на явный бред
@@ -28,13 +51,77 @@ class SpamProtector:
         
         return False, "OK"
     
+    def is_spam_batch(self, items):
+        """Проверка списка заявок (словари с 'title' и 'description')
+        
+        Возвращает список пар (is_spam, сообщение) - те же ответы, что и is_spam для каждой заявки.
+        Признаки бессмыслицы ищутся одним проходом numpy по всем текстам пачки.
+        """
+        if len(items) < MIN_VECTORIZED_BATCH:
+            return [self.is_spam(item.get('title', ''), item.get('description', '')) for item in items]
+        
+        results = [None] * len(items)
+        texts, positions = [], []
+        for i, item in enumerate(items):
+            title = item.get('title', '')
+            description = item.get('description', '')
+            full_text = (f"{title}. {description}" if description else title).strip()
+            if len(full_text) < MIN_TEXT_LENGTH:
+                results[i] = (True, "Слишком короткий запрос. Минимум 5 символов.")
+            elif len(full_text) > MAX_TEXT_LENGTH:
+                results[i] = (True, "Слишком длинный запрос. Максимум 2000 символов.")
+            else:
+                texts.append(full_text)
+                positions.append(i)
+        
+        if texts:
+            for i, gibberish in zip(positions, self._is_gibberish_batch(texts)):
+                results[i] = (True, "Текст похож на бессмыслицу") if gibberish else (False, "OK")
+        return results
+    
     def _is_gibberish(self, text):
         """Проверяем, является ли текст явным бредом"""
         text_lower = text.lower()
         
         # Проверяем только самые явные паттерны бессмыслицы
-        for pattern in self.gibberish_patterns:
-            if re.search(pattern, text_lower):
+        for search in self._gibberish_searches:
+            if search(text_lower):
                 return True
         
-        return False
\ No newline at end of file
+        return False
+    
+    @staticmethod
+    def _is_gibberish_batch(texts):
+        """_is_gibberish для списка текстов одним проходом по массиву кодов символов
+        
+        Тексты склеиваются через разделитель с кодом вне Unicode: он не входит ни в один класс
+        символов и не повторяется, поэтому серии не переходят через границу текстов.
+        Массив разбивается на серии одинаковых значений дважды: по классу символа
+        (латиница, цифры, спецсимволы) и по самому символу (повторы, кроме переводов строки).
+        """
+        lowered = [text.lower() for text in texts]
+        # surrogatepass: одиночные суррогаты (допустимы в JSON как "\ud800") кодируются как есть
+        codes = np.frombuffer("\0".join(lowered).encode("utf-32-le", errors="surrogatepass"),
+                              dtype=np.uint32).copy()
+        # Начало каждого текста в склеенном массиве; перед ним (кроме первого) - разделитель
+        starts = np.cumsum([0] + [len(text) + 1 for text in lowered[:-1]])
+        codes[starts[1:] - 1] = SEPARATOR_CODE
+        
+        classes = ASCII_CLASSES[np.minimum(codes, 128)]
+        class_run_starts, class_run_lengths = _runs(classes)
+        repeat_run_starts, repeat_run_lengths = _runs(codes)
+        
+        found = np.concatenate((
+            class_run_starts[class_run_lengths >= CLASS_RUN_LENGTHS[classes[class_run_starts]]],
+            repeat_run_starts[(repeat_run_lengths >= REPEATED_CHAR_RUN) & (codes[repeat_run_starts] != NEWLINE_CODE)]
+        ))
+        gibberish = np.zeros(len(texts), dtype=bool)
+        gibberish[np.searchsorted(starts, found, side="right") - 1] = True
+        return gibberish.tolist()
+
+
+def _runs(values):
+    """Начала и длины серий одинаковых подряд идущих значений массива"""
+    run_starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+    run_lengths = np.diff(np.append(run_starts, len(values)))
+    return run_starts, run_lengths
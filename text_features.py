@@ -0,0 +1,137 @@
+import re
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer, TfidfTransformer, HashingVectorizer
+from record_store import StringColumn
+
+STOP_WORDS = ['и', 'в', 'на', 'с', 'по', 'для', 'за', 'к']
+# Токены как у token_pattern sklearn по умолчанию: слова из двух и более символов
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+# Версия формата кэша счетчиков токенов в блоках RecordStore
+TOKEN_COUNTS_VERSION = 1
+
+DTYPES = {"float32": np.float32, "float64": np.float64}
+
+
+def normalize_russian(text):
+    """Нижний регистр и ё -> е: "Ёлка" и "елка" дают один токен"""
+    return text.lower().replace("ё", "е")
+
+
+class StemmingTokenizer:
+    """Токенизатор с грубым стеммингом: токены обрезаются до stem_length символов
+
+    Для русского языка окончания сильно размножают словарь ("принтер", "принтера",
+    "принтеру"); обрезка основы - дешевая замена морфологическому анализатору.
+    """
+
+    def __init__(self, stem_length):
+        self.stem_length = stem_length
+
+    def __call__(self, text):
+        return [token[:self.stem_length] for token in TOKEN_PATTERN.findall(text)]
+
+
+def create_vectorizer(config):
+    """Новый (необученный) векторизатор текста по настройкам модели
+
+    В инкрементальном режиме и при text_hashing=True - HashingVectorizer: он не обучается,
+    поэтому не требует прохода по всей истории. Иначе - TfidfVectorizer.
+    Вне инкрементального режима признаков столько же, сколько в словаре TF-IDF (max_features):
+    время обучения леса растет с числом признаков, а дообучения, которому нужен запас
+    хэш-пространства под новые слова, здесь нет.
+    """
+    params = {
+        "analyzer": config["text_analyzer"],
+        "ngram_range": tuple(config["ngram_range"]),
+        "dtype": DTYPES[config["text_dtype"]],
+    }
+    if config["normalize_text"]:
+        params["preprocessor"] = normalize_russian
+    if config["text_analyzer"] == "word":
+        params["stop_words"] = STOP_WORDS
+        if config["stem_length"]:
+            params["tokenizer"] = StemmingTokenizer(config["stem_length"])
+            params["token_pattern"] = None
+
+    if config["incremental"]:
+        return HashingVectorizer(n_features=config["hashing_n_features"], alternate_sign=False, **params)
+    if config["text_hashing"]:
+        return HashingVectorizer(n_features=config["max_features"] or config["hashing_n_features"],
+                                 alternate_sign=False, **params)
+    return TfidfVectorizer(max_features=config["max_features"], **params)
+
+
+def fit_transform(vectorizer, store):
+    """Обучить векторизатор на записях RecordStore и вернуть матрицу признаков
+
+    Для TfidfVectorizer счетчики токенов каждого блока хранилища считаются один раз и
+    кэшируются в блоке (и сохраняются вместе с записями), поэтому переобучение
+    токенизирует только новые блоки. Словарь, отбор max_features и idf получаются
+    такими же, как у vectorizer.fit_transform по тем же текстам.
+    """
+    if not isinstance(vectorizer, TfidfVectorizer):
+        # HashingVectorizer не обучается
+        return vectorizer.transform(store.iter_full_text())
+
+    analyze = vectorizer.build_analyzer()
+    key = _token_counts_key(vectorizer)
+    chunk_counts = store.map_chunks(key, lambda texts: _count_tokens(analyze, texts))
+
+    # Общий словарь блоков и матрица счетчиков в его индексах
+    vocabulary = {}
+    chunk_ids = [np.array([vocabulary.setdefault(term, len(vocabulary)) for term in terms], dtype=np.int64)
+                 for terms, _ in chunk_counts]
+    if not vocabulary:
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+    counts = sp.vstack([sp.csr_matrix((chunk.data, ids[chunk.indices], chunk.indptr),
+                                      shape=(chunk.shape[0], len(vocabulary)))
+                        for (_, chunk), ids in zip(chunk_counts, chunk_ids)], format="csr")
+    counts = counts.astype(vectorizer.dtype)
+    counts.sort_indices()
+
+    vocabulary, counts = _limit_features(vocabulary, counts, vectorizer.max_features)
+    transformer = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                   smooth_idf=vectorizer.smooth_idf, sublinear_tf=vectorizer.sublinear_tf)
+    transformer.fit(counts)
+    vectorizer.vocabulary_ = vocabulary
+    vectorizer.idf_ = transformer.idf_
+    return transformer.transform(counts, copy=False)
+
+
+def _limit_features(vocabulary, counts, max_features):
+    """Признаки в алфавитном порядке, не больше max_features самых частых - как в CountVectorizer"""
+    terms = sorted(vocabulary)
+    order = np.array([vocabulary[term] for term in terms], dtype=np.int64)
+    counts = counts[:, order]
+    if max_features is not None and len(terms) > max_features:
+        term_frequencies = np.asarray(counts.sum(axis=0)).ravel()
+        kept = np.sort((-term_frequencies).argsort()[:max_features])
+        terms = [terms[i] for i in kept]
+        counts = counts[:, kept]
+    return {term: i for i, term in enumerate(terms)}, counts
+
+
+def _count_tokens(analyze, texts):
+    """Словарь блока (StringColumn) и CSR-матрица счетчиков его токенов (int32)"""
+    vocabulary = {}
+    indices, values, indptr = [], [], [0]
+    for text in texts:
+        doc_counts = {}
+        for token in analyze(text):
+            index = vocabulary.setdefault(token, len(vocabulary))
+            doc_counts[index] = doc_counts.get(index, 0) + 1
+        indices.extend(doc_counts)
+        values.extend(doc_counts.values())
+        indptr.append(len(indices))
+    counts = sp.csr_matrix((np.array(values, dtype=np.int32), np.array(indices, dtype=np.int32),
+                            np.array(indptr, dtype=np.int64)), shape=(len(indptr) - 1, len(vocabulary)))
+    return StringColumn.from_values(vocabulary), counts
+
+
+def _token_counts_key(vectorizer):
+    """Ключ кэша счетчиков: зависит только от настроек токенизации"""
+    tokenizer = vectorizer.tokenizer
+    return ("token_counts", TOKEN_COUNTS_VERSION, vectorizer.analyzer, vectorizer.ngram_range,
+            vectorizer.preprocessor is not None, tuple(vectorizer.stop_words or ()),
+            tokenizer.stem_length if isinstance(tokenizer, StemmingTokenizer) else None)
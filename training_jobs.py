@@ -0,0 +1,221 @@
+import threading
+import uuid
+import os
+import glob
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+
+class TrainingJobManager:
+    """Фоновые задачи обучения модели
+
+    Одновременно выполняется не больше одной задачи: повторный запуск во время
+    обучения возвращает уже идущую задачу. Задача - функция, которая возвращает
+    словарь результата с полем "status" ("success" или "error").
+
+    С state_dir состояние задач хранится в файлах, а "одна задача за раз" обеспечивается
+    файловой блокировкой - так задачи видны всем воркерам gunicorn, и обучение идет
+    только в одном из них. Блокировку берет только запуск задачи; is_running читает
+    сохраненное состояние (файл current_job существует, пока задача выполняется).
+    """
+
+    LOCK_FILE = "training.lock"
+    CURRENT_FILE = "current_job"
+
+    def __init__(self, max_history=20, state_dir=None):
+        self.max_history = max_history
+        self.state_dir = state_dir
+        self.jobs = OrderedDict()
+        self.current_job_id = None
+        self._threads = {}  # Потоки задач этого процесса, которые еще выполняются
+        self._lock = threading.Lock()
+        self._lock_file = None
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def submit(self, name, func, *args, **kwargs):
+        """Запустить задачу в фоне. Возвращает (задача, создана ли новая задача)"""
+        with self._lock:
+            if self.current_job_id:
+                return dict(self.jobs[self.current_job_id]), False
+
+            if not self._acquire_process_lock():
+                # Обучение уже идет в другом процессе
+                running = self._read_job(self._read_current_job_id())
+                return running or {"job_id": None, "status": "running"}, False
+
+            job_id = uuid.uuid4().hex[:12]
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "name": name,
+                "status": "queued",
+                "pid": os.getpid(),
+                "created_at": datetime.now().isoformat(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+            self.current_job_id = job_id
+            self._write_current_job_id(job_id)
+            self._persist(job_id)
+            self._trim_history()
+            job = dict(self.jobs[job_id])
+
+        thread = threading.Thread(target=self._run, args=(job_id, func, args, kwargs),
+                                  name=f"training-{job_id}", daemon=True)
+        with self._lock:
+            self._threads[job_id] = thread
+        thread.start()
+        return job, True
+
+    def wait(self, job_id, timeout=None):
+        """Дождаться окончания задачи, запущенной в этом процессе. Возвращает ее состояние"""
+        with self._lock:
+            thread = self._threads.get(job_id)
+        if thread:
+            thread.join(timeout)
+        return self.get_job(job_id)
+
+    def get_job(self, job_id):
+        """Состояние задачи по ID или None"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return dict(job)
+        return self._read_job(job_id)
+
+    def list_jobs(self):
+        """Последние задачи, новые первыми"""
+        if self.state_dir:
+            jobs = [self._read_job(os.path.basename(path)[:-len(".json")])
+                    for path in glob.glob(os.path.join(self.state_dir, "*.json"))]
+            return sorted((job for job in jobs if job), key=lambda job: job["created_at"], reverse=True)
+        with self._lock:
+            return [dict(job) for job in reversed(self.jobs.values())]
+
+    def is_running(self):
+        """Идет ли обучение (в этом или другом процессе) - по сохраненному состоянию, без блокировки"""
+        with self._lock:
+            if self.current_job_id is not None:
+                return True
+        if fcntl is None:  # Без файловой блокировки обучение других процессов не учитывается
+            return False
+        job = self._read_job(self._read_current_job_id())
+        # Процесс, упавший во время обучения, оставляет задачу в статусе running
+        return bool(job) and job["status"] in ("queued", "running") and self._process_alive(job["pid"])
+
+    def _run(self, job_id, func, args, kwargs):
+        self._update(job_id, status="running", started_at=datetime.now().isoformat())
+        try:
+            result = func(*args, **kwargs)
+            status = "succeeded" if result.get("status") == "success" else "failed"
+            self._update(job_id, status=status, result=result)
+        except Exception as e:
+            print(f"❌ Ошибка фоновой задачи обучения {job_id}: {e}")
+            self._update(job_id, status="failed", error=str(e))
+        finally:
+            with self._lock:
+                self.jobs[job_id]["finished_at"] = datetime.now().isoformat()
+                self._persist(job_id)
+                self.current_job_id = None
+                self._threads.pop(job_id, None)
+                self._clear_current_job_id(job_id)
+                self._release_process_lock()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self.jobs[job_id].update(fields)
+            self._persist(job_id)
+
+    def _trim_history(self):
+        while len(self.jobs) > self.max_history:
+            oldest_id = next(iter(self.jobs))
+            if oldest_id == self.current_job_id:
+                break
+            del self.jobs[oldest_id]
+            if self.state_dir:
+                try:
+                    os.remove(os.path.join(self.state_dir, f"{oldest_id}.json"))
+                except OSError:
+                    pass
+
+    # Межпроцессное состояние (только при state_dir)
+
+    def _acquire_process_lock(self):
+        """Захватить файловую блокировку обучения без ожидания"""
+        if not self.state_dir or fcntl is None:
+            return True
+        lock_file = open(os.path.join(self.state_dir, self.LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_process_lock(self):
+        if self._lock_file:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _persist(self, job_id):
+        if not self.state_dir:
+            return
+        path = os.path.join(self.state_dir, f"{job_id}.json")
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.jobs[job_id], f, ensure_ascii=False, default=str)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить состояние задачи {job_id}: {e}")
+
+    def _read_job(self, job_id):
+        if not self.state_dir or not job_id:
+            return None
+        try:
+            with open(os.path.join(self.state_dir, f"{job_id}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_current_job_id(self, job_id):
+        if self.state_dir:
+            with open(os.path.join(self.state_dir, self.CURRENT_FILE), "w") as f:
+                f.write(job_id)
+
+    def _clear_current_job_id(self, job_id):
+        if self.state_dir and self._read_current_job_id() == job_id:
+            try:
+                os.remove(os.path.join(self.state_dir, self.CURRENT_FILE))
+            except OSError:
+                pass
+
+    def _read_current_job_id(self):
+        if not self.state_dir:
+            return None
+        try:
+            with open(os.path.join(self.state_dir, self.CURRENT_FILE)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _process_alive(pid):
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:  # Процесс есть, но принадлежит другому пользователю
+            return True
+        return True
@@ -0,0 +1,11 @@
+"""WSGI-точка входа для продакшн-сервера
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+С preload_app модель загружается в мастер-процессе до fork, и воркеры
+разделяют ее страницы памяти copy-on-write. Только до первого переобучения:
+новую модель каждый воркер загружает сам, и у него своя копия деревьев леса.
+"""
+from app import app, load_saved_model
+
+load_saved_model()